@@ -0,0 +1,118 @@
+"""
+Deterministic generator for large synthetic vaults, used by the benchmarks.
+"""
+
+import base64
+import json
+import os
+import random
+from pathlib import Path
+from typing import Optional
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from lib2fas._security import derive_key
+from lib2fas._types import AnyDict, TwoFactorAuthDetails, into_class
+
+# 100k is slow to generate (and to load), so it's only included when explicitly requested.
+SIZES = [1_000, 10_000] + ([100_000] if os.getenv("LIB2FAS_BENCH_LARGE") else [])
+
+ISSUERS = ["GitHub", "Google", "Microsoft", "Amazon", "Dropbox", "Slack", "GitLab", "Discord"]
+
+
+def random_secret(rng: random.Random) -> str:
+    """
+    Create a base32 TOTP secret.
+    """
+    return base64.b32encode(rng.randbytes(20)).decode()
+
+
+def service_dict(rng: random.Random, idx: int, updated_at: int = 1_700_000_000_000) -> AnyDict:
+    """
+    Create one service in the same structure the 2fas app exports.
+    """
+    secret = random_secret(rng)
+    issuer = rng.choice(ISSUERS)
+    account = f"user{idx}@example.com"
+    return {
+        "name": f"{issuer} {idx}",
+        "secret": secret,
+        "updatedAt": updated_at + idx,
+        "otp": {
+            "link": f"otpauth://totp/{issuer}:{account}?secret={secret}&issuer={issuer}",
+            "label": account,
+            "account": account,
+            "issuer": issuer,
+            "tokenType": "TOTP",
+            "source": "Link",
+        },
+        "order": {"position": idx},
+        "icon": {
+            "selected": "Label",
+            "label": {"text": issuer[:2].upper(), "backgroundColor": "Orange"},
+            "iconCollection": {"id": "a5b3fb65-4ec5-43e6-8ec1-49e24ca9e7ad"},
+        },
+    }
+
+
+def service_dicts(count: int, seed: int = 0) -> list[AnyDict]:
+    """
+    Create 'count' services; the same seed always gives the same services.
+    """
+    rng = random.Random(seed)
+    return [service_dict(rng, idx) for idx in range(count)]
+
+
+def services(count: int, seed: int = 0) -> list[TwoFactorAuthDetails]:
+    """
+    Like service_dicts, but loaded into TwoFactorAuthDetails instances.
+    """
+    return into_class(service_dicts(count, seed), TwoFactorAuthDetails)
+
+
+def other_device(entries: list[AnyDict], seed: int = 1) -> list[AnyDict]:
+    """
+    Simulate an export of the same vault from another device.
+
+    Half of the services are shared (of which half were updated later), the other half only exist on this device.
+    """
+    rng = random.Random(seed)
+    half = len(entries) // 2
+    shared = [
+        {**entry, "updatedAt": entry["updatedAt"] + (1 if idx % 2 else -1)} for idx, entry in enumerate(entries[:half])
+    ]
+    return shared + [service_dict(rng, idx) for idx in range(len(entries), len(entries) + half)]
+
+
+def encrypt_services(entries: list[AnyDict], passphrase: str, seed: int = 0) -> str:
+    """
+    Encrypt services into a 'servicesEncrypted' value, with a salt and nonce derived from the seed.
+    """
+    rng = random.Random(seed)
+    salt, nonce = rng.randbytes(256), rng.randbytes(12)
+    plaintext = json.dumps(entries, separators=(",", ":")).encode()
+    encrypted = AESGCM(derive_key(passphrase, salt)).encrypt(nonce, plaintext, None)
+    return ":".join(base64.b64encode(part).decode() for part in (encrypted, salt, nonce))
+
+
+def write_vault(path: Path, count: int, passphrase: Optional[str] = None, seed: int = 0) -> Path:
+    """
+    Write a .2fas file with 'count' services, encrypted if a passphrase is passed.
+
+    The same arguments always result in the same file.
+    """
+    entries = service_dicts(count, seed)
+    data: AnyDict = {
+        "services": [] if passphrase else entries,
+        "groups": [],
+        "updatedAt": 1_700_000_000_000,
+        "schemaVersion": 4,
+        "appVersionCode": 5000012,
+        "appVersionName": "5.2.0",
+        "appOrigin": "android",
+    }
+    if passphrase:
+        data["servicesEncrypted"] = encrypt_services(entries, passphrase, seed)
+
+    path.write_text(json.dumps(data))
+    return path
@@ -0,0 +1,131 @@
+"""
+Shared fixtures for the benchmarks.
+
+Every benchmark stores extra stats in its results (see `measure`):
+    - services: amount of services processed per call
+    - throughput: services per second (based on the mean)
+    - p50/p95/p99: latency percentiles in seconds
+    - peak_memory: peak memory allocated during one (untimed) call, in bytes
+
+Usage:
+    pytest benchmarks --benchmark-autosave  # store results in .benchmarks/, tagged with the current commit
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%  # compare with the last saved run
+"""
+
+import math
+import tracemalloc
+import typing
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from lib2fas.core import TwoFactorStorage, new_auth_storage
+
+from ._generator import services, write_vault
+
+PASSPHRASE = "benchmark"
+
+T = typing.TypeVar("T")
+
+
+def percentile(data: list[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of (already sorted) data.
+    """
+    return data[max(math.ceil(pct / 100 * len(data)) - 1, 0)]
+
+
+class Measure(typing.Protocol):
+    def __call__(
+        self,
+        func: typing.Callable[..., T],
+        *args: typing.Any,
+        services: int,
+        rounds: int = 5,
+        setup: typing.Optional[typing.Callable[[], tuple[typing.Any, ...]]] = None,
+    ) -> T: ...
+
+
+@pytest.fixture
+def measure(benchmark) -> Measure:
+    """
+    Benchmark 'func' and record throughput, latency percentiles and peak memory.
+
+    If 'func' modifies its arguments, pass 'setup' (instead of args) to create fresh arguments for every round.
+    """
+
+    def run(
+        func: typing.Callable[..., T],
+        *args: typing.Any,
+        services: int,
+        rounds: int = 5,
+        setup: typing.Optional[typing.Callable[[], tuple[typing.Any, ...]]] = None,
+    ) -> T:
+        if setup:
+            result: T = benchmark.pedantic(func, setup=lambda: (setup(), {}), rounds=rounds, warmup_rounds=1)
+        else:
+            result = benchmark.pedantic(func, args=args, rounds=rounds, iterations=1, warmup_rounds=1)
+
+        if benchmark.stats is None:  # --benchmark-disable (e.g. a smoke run): nothing was timed
+            return result
+
+        data = sorted(benchmark.stats.stats.data)
+        benchmark.extra_info["services"] = services
+        benchmark.extra_info["throughput"] = services / benchmark.stats.stats.mean
+        for pct in (50, 95, 99):
+            benchmark.extra_info[f"p{pct}"] = percentile(data, pct)
+
+        # measured separately, since tracing allocations slows everything down:
+        call_args = setup() if setup else args
+        tracemalloc.start()
+        try:
+            func(*call_args)
+            benchmark.extra_info["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return result
+
+    return run
+
+
+@pytest.fixture(scope="session")
+def vault_dir(tmp_path_factory) -> Path:
+    return tmp_path_factory.mktemp("vaults")
+
+
+@pytest.fixture(scope="session")
+def plain_vault(vault_dir) -> typing.Callable[[int], Path]:
+    def get(size: int) -> Path:
+        path = vault_dir / f"plain-{size}.2fas"
+        return path if path.exists() else write_vault(path, size)
+
+    return get
+
+
+@pytest.fixture(scope="session")
+def encrypted_vault(vault_dir) -> typing.Callable[[int], Path]:
+    def get(size: int) -> Path:
+        path = vault_dir / f"encrypted-{size}.2fas"
+        return path if path.exists() else write_vault(path, size, PASSPHRASE)
+
+    return get
+
+
+_storages: dict[int, TwoFactorStorage] = {}
+
+
+@pytest.fixture(scope="session")
+def storage() -> typing.Callable[[int], TwoFactorStorage]:
+    """
+    Building TwoFactorAuthDetails is slow, so storages are shared between benchmarks (which must not modify them).
+    """
+
+    def get(size: int) -> TwoFactorStorage:
+        if size not in _storages:
+            _storages[size] = new_auth_storage(services(size))
+        return _storages[size]
+
+    return get
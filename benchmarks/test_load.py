@@ -0,0 +1,37 @@
+import pyjson5
+import pytest
+
+from lib2fas import load_services
+from lib2fas._security import _decrypt
+
+from ._generator import SIZES, service_dicts
+from .conftest import PASSPHRASE
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_load_plain(measure, plain_vault, size):
+    path = plain_vault(size)
+    storage = measure(load_services, path, services=size, rounds=3)
+    assert len(storage) == size
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_load_encrypted(measure, encrypted_vault, size):
+    path = encrypted_vault(size)
+    storage = measure(load_services, path, 0, PASSPHRASE, services=size, rounds=3)
+    assert len(storage) == size
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_load_only(measure, encrypted_vault, size):
+    path = encrypted_vault(size)
+    name = service_dicts(size)[size // 2]["name"]
+    storage = measure(load_services, path, 0, PASSPHRASE, name, services=size)
+    assert len(storage) == 1
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_decrypt(measure, encrypted_vault, size):
+    encrypted = pyjson5.loads(encrypted_vault(size).read_text())["servicesEncrypted"]
+    dicts = measure(_decrypt, encrypted, PASSPHRASE, services=size)
+    assert len(dicts) == size
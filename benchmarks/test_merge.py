@@ -0,0 +1,26 @@
+import pytest
+
+from lib2fas._types import TwoFactorAuthDetails, into_class
+from lib2fas.core import new_auth_storage
+
+from ._generator import SIZES, other_device, service_dicts
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_merge(measure, size):
+    dicts = service_dicts(size)
+    existing = into_class(dicts, TwoFactorAuthDetails)
+    incoming = into_class(other_device(dicts), TwoFactorAuthDetails)
+
+    def setup():
+        # merge modifies the storage, so every round starts from a fresh one
+        return new_auth_storage(existing), incoming
+
+    def merge(storage, entries):
+        return storage.merge(entries)
+
+    report = measure(merge, services=size + len(incoming), setup=setup)
+
+    assert len(report.added) == size // 2
+    assert len(report.replaced) == size // 4
+    assert len(report.skipped) == size // 2 - size // 4
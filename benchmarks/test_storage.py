@@ -0,0 +1,45 @@
+import io
+
+import pytest
+
+from ._generator import SIZES
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_find_exact(measure, storage, size):
+    services = storage(size)
+    name = services.keys()[size // 2]
+    found = measure(services.find, name, services=size, rounds=100)
+    assert found
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_find_fuzzy_key(measure, storage, size):
+    services = storage(size)
+    found = measure(services.find, "githbu", services=size)
+    assert found
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_find_fuzzy_value(measure, storage, size):
+    # no key matches, so the (json) representation of every service is searched
+    services = storage(size)
+    found = measure(services.find, "user1@example.com", services=size, rounds=1)
+    assert found
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_generate(measure, storage, size):
+    services = storage(size)
+    codes = measure(services.generate, services=size)
+    assert len(codes) == size
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_export(measure, storage, size):
+    services = storage(size)
+
+    def export():
+        return services.export(io.StringIO())
+
+    assert measure(export, services=size) == size
@@ -2,6 +2,7 @@
 This file exposes the most important element to the global lib2fas namespace.
 """
 
-from .core import load_services
+from ._security import clear_key_cache
+from .core import load_service_names, load_services
 
-__all__ = ["load_services"]
+__all__ = ["clear_key_cache", "load_service_names", "load_services"]
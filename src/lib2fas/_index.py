@@ -0,0 +1,211 @@
+"""
+This file deals with the (optional) sidecar index of encrypted .2fas files.
+
+The index is stored next to the .2fas file (e.g. `vault.2fas.idx`) and holds the names, accounts and order positions \
+ of all services, plus the byte offsets of each service in the decrypted plaintext.
+It is encrypted like the 2fas file itself (same passphrase and salt, so the cached derived key can be reused)
+ and is invalidated when the source file changes.
+"""
+
+import base64
+import hashlib
+import json
+import re
+import sys
+import typing
+from pathlib import Path
+from typing import Optional
+
+import cryptography.exceptions
+import pyjson5
+
+from ._security import _decrypt_bytes, _encrypt_bytes, _loads_services
+from ._types import AnyDict, TwoFactorAuthDetails, into_class
+from .instrumentation import span
+from .utils import select_by_name
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
+# a (JSON) string as a whole, or a single bracket.
+# Matching strings as one token means brackets inside of strings are skipped.
+_TOKENS = re.compile(rb'"(?:[^"\\]|\\.)*"|[\[\]{}]', re.DOTALL)
+_OPEN = frozenset(b"[{")
+_CLOSE = frozenset(b"]}")
+
+
+class IndexEntry(typing.NamedTuple):
+    """
+    One service in the sidecar index.
+
+    'start' and 'end' are byte offsets of the service's JSON object in the decrypted plaintext.
+    """
+
+    name: str
+    account: Optional[str]
+    position: int
+    start: int
+    end: int
+
+
+def index_path(filepath: Path) -> Path:
+    """
+    Get the location of the sidecar index for a .2fas file.
+    """
+    return filepath.with_name(filepath.name + INDEX_SUFFIX)
+
+
+def service_spans(plaintext: bytes) -> list[tuple[int, int]]:
+    """
+    Find the (start, end) byte offsets of every object in the top-level JSON array of decrypted services.
+    """
+    spans = []
+    depth = 0
+    start = 0
+    for match in _TOKENS.finditer(plaintext):
+        char = plaintext[match.start()]
+        if char in _OPEN:
+            depth += 1
+            if depth == 2:
+                start = match.start()
+        elif char in _CLOSE:
+            if depth == 2:
+                spans.append((start, match.end()))
+            depth -= 1
+
+    return spans
+
+
+def fingerprint(filepath: Path, raw: bytes) -> AnyDict:
+    """
+    Describe the current version of the source file, used to check whether an index is still valid.
+    """
+    stat = filepath.stat()
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": hashlib.sha256(raw).hexdigest(),
+    }
+
+
+def _is_fresh(source: AnyDict, filepath: Path, raw: Optional[bytes]) -> bool:
+    """
+    The index is fresh if mtime and size are unchanged or, failing that, if the content hash still matches.
+    """
+    stat = filepath.stat()
+    if source.get("mtime_ns") == stat.st_mtime_ns and source.get("size") == stat.st_size:
+        return True
+
+    if raw is None:
+        raw = filepath.read_bytes()
+    return bool(source.get("sha256") == hashlib.sha256(raw).hexdigest())
+
+
+def read_index(filepath: Path, passphrase: str, raw: bytes = None) -> Optional[list[IndexEntry]]:
+    """
+    Load the sidecar index of a .2fas file.
+
+    Args:
+        filepath: path to the .2fas file (not to the index itself)
+        passphrase: password of the .2fas file
+        raw: contents of the .2fas file, if already read (only used when the mtime changed)
+
+    Returns:
+        None if there is no (valid or up-to-date) index.
+
+    Raises:
+        PermissionError on invalid password.
+    """
+    path = index_path(filepath)
+    try:
+        index = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+        return None
+
+    source = index.get("source")
+    if not isinstance(source, dict) or not _is_fresh(source, filepath, raw):
+        return None
+
+    try:
+        entries = json.loads(_decrypt_bytes(index["entries"], passphrase))
+        return [IndexEntry(*entry) for entry in entries]
+    except cryptography.exceptions.InvalidTag as e:
+        raise PermissionError("Invalid passphrase for file.") from e
+    except (AttributeError, KeyError, TypeError, ValueError):
+        # damaged index (missing keys, bad base64 or JSON, wrong types or shapes): it's only a cache, so rebuild it
+        return None
+
+
+def write_index(
+    filepath: Path, raw: bytes, encrypted: str, passphrase: str, plaintext: bytes, dicts: list[AnyDict]
+) -> None:
+    """
+    Store a sidecar index for a .2fas file, encrypted with the same passphrase and salt as 'encrypted'.
+
+    Failing to write the index is not fatal, since it's only a cache.
+    """
+    spans = service_spans(plaintext)
+    if len(spans) != len(dicts):  # pragma: no cover
+        # unexpected structure, don't store an index that could point to the wrong services
+        return
+
+    entries = [
+        IndexEntry(
+            name=service.get("name") or "",
+            account=(service.get("otp") or {}).get("account"),
+            position=(service.get("order") or {}).get("position") or 0,
+            start=start,
+            end=end,
+        )
+        for service, (start, end) in zip(dicts, spans)
+    ]
+
+    _, salt, _ = encrypted.split(":")
+    index = {
+        "version": INDEX_VERSION,
+        "source": fingerprint(filepath, raw),
+        "entries": _encrypt_bytes(json.dumps(entries).encode(), passphrase, base64.b64decode(salt)),
+    }
+
+    try:
+        index_path(filepath).write_text(json.dumps(index))
+    except OSError as e:  # pragma: no cover
+        print(f"Could not write index: {e}", file=sys.stderr)
+
+
+def decrypt_indexed(
+    filepath: Path, raw: bytes, encrypted: str, passphrase: str, only: Optional[set[str]] = None
+) -> list[TwoFactorAuthDetails]:
+    """
+    Like `decrypt`, but use (and maintain) the sidecar index.
+
+    With an up-to-date index, only the services in 'only' are parsed from the plaintext.
+
+    Raises:
+        PermissionError
+    """
+    try:
+        plaintext = _decrypt_bytes(encrypted, passphrase)
+    except cryptography.exceptions.InvalidTag as e:
+        raise PermissionError("Invalid passphrase for file.") from e
+
+    with span("index.read") as phase:
+        index = read_index(filepath, passphrase, raw)
+        phase.set(fresh=index is not None)
+
+    if index is None:
+        dicts = _loads_services(plaintext)
+        with span("index.write", entries=len(dicts)):
+            write_index(filepath, raw, encrypted, passphrase, plaintext, dicts)
+        return into_class(select_by_name(dicts, only), TwoFactorAuthDetails)
+
+    if only is None:
+        return into_class(_loads_services(plaintext), TwoFactorAuthDetails)
+
+    return into_class(
+        [pyjson5.loads(plaintext[entry.start : entry.end].decode()) for entry in index if entry.name.lower() in only],
+        TwoFactorAuthDetails,
+    )
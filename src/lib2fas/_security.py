@@ -6,11 +6,14 @@ import base64
 import getpass
 import hashlib
 import logging
+import os
 import sys
 import tempfile
+import threading
 import time
 import typing
 import warnings
+from collections import OrderedDict
 from pathlib import Path
 from typing import Any, Optional
 
@@ -25,6 +28,8 @@ from keyring.backend import KeyringBackend
 from keyring.errors import KeyringError
 
 from ._types import AnyDict, TwoFactorAuthDetails, into_class
+from .instrumentation import span
+from .utils import select_by_name
 
 if typing.TYPE_CHECKING:  # pragma: no cover
     from secretstorage import Item as SecretStorageItem
@@ -34,28 +39,94 @@ keyring_logger = logging.getLogger("keyring")
 keyring_logger.setLevel(logging.ERROR)  # Set the logging level to ERROR for keyring logger
 
 
-def _decrypt(encrypted: str, passphrase: str) -> list[AnyDict]:
+# hash of (passphrase, salt) -> derived key, most recently used last.
+# Keyed on a hash so passphrases (including wrong guesses) are not kept in memory for the life of the process.
+# The derived keys themselves can still decrypt their file: call `clear_key_cache()` when they're no longer needed.
+_key_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+_key_cache_lock = threading.Lock()
+KEY_CACHE_SIZE = 16
+
+
+def _cache_key(passphrase: str, salt: bytes) -> bytes:
+    return hashlib.sha256(len(salt).to_bytes(4, "big") + salt + passphrase.encode()).digest()
+
+
+def derive_key(passphrase: str, salt: bytes) -> bytes:
+    """
+    Derive the AES key for a passphrase and salt (PBKDF2, like the 2fas app does).
+
+    The result is cached, so the expensive key derivation only happens once per file and passphrase.
+    """
+    cache_key = _cache_key(passphrase, salt)
+    with _key_cache_lock:
+        if (key := _key_cache.get(cache_key)) is not None:
+            _key_cache.move_to_end(cache_key)
+            return key
+
+    with span("kdf", iterations=10000):
+        kdf = PBKDF2HMAC(algorithm=SHA256(), length=32, salt=salt, iterations=10000)
+        key = kdf.derive(passphrase.encode())
+
+    with _key_cache_lock:
+        _key_cache[cache_key] = key
+        while len(_key_cache) > KEY_CACHE_SIZE:
+            _key_cache.popitem(last=False)
+    return key
+
+
+def clear_key_cache() -> None:
+    """
+    Forget all cached derived keys, e.g. when a vault is locked again.
+    """
+    with _key_cache_lock:
+        _key_cache.clear()
+
+
+def _decrypt_bytes(encrypted: str, passphrase: str) -> bytes:
     # thanks https://github.com/wodny/decrypt-2fas-backup/blob/master/decrypt-2fas-backup.py
     credentials_enc, pbkdf2_salt, nonce = map(base64.b64decode, encrypted.split(":"))
-    kdf = PBKDF2HMAC(algorithm=SHA256(), length=32, salt=pbkdf2_salt, iterations=10000)
-    key = kdf.derive(passphrase.encode())
-    aesgcm = AESGCM(key)
-    credentials_dec = aesgcm.decrypt(nonce, credentials_enc, None)
-    dec = pyjson5.loads(credentials_dec.decode())  # type: list[AnyDict]
+    aesgcm = AESGCM(derive_key(passphrase, pbkdf2_salt))
+    with span("aes_gcm.decrypt", bytes=len(credentials_enc)):
+        return aesgcm.decrypt(nonce, credentials_enc, None)
+
+
+def _encrypt_bytes(data: bytes, passphrase: str, salt: bytes) -> str:
+    """
+    Inverse of _decrypt_bytes: encrypt data into the same 'ciphertext:salt:nonce' format 2fas uses.
+    """
+    nonce = os.urandom(12)
+    aesgcm = AESGCM(derive_key(passphrase, salt))
+    credentials_enc = aesgcm.encrypt(nonce, data, None)
+    return ":".join(base64.b64encode(part).decode() for part in (credentials_enc, salt, nonce))
+
+
+def _loads_services(credentials_dec: bytes) -> list[AnyDict]:
+    with span("parse_plaintext", bytes=len(credentials_dec)):
+        dec = pyjson5.loads(credentials_dec.decode())  # type: list[AnyDict]
     if not isinstance(dec, list):  # pragma: no cover
         raise TypeError("Unexpected data structure in input file.")
     return dec
 
 
-def decrypt(encrypted: str, passphrase: str) -> list[TwoFactorAuthDetails]:
+def _decrypt(encrypted: str, passphrase: str) -> list[AnyDict]:
+    return _loads_services(_decrypt_bytes(encrypted, passphrase))
+
+
+def decrypt(encrypted: str, passphrase: str, only: Optional[set[str]] = None) -> list[TwoFactorAuthDetails]:
     """
     Decrypt the 'servicesEncrypted' block with a passphrase into a list of TwoFactorAuthDetails instances.
 
+    Args:
+        encrypted: the 'servicesEncrypted' value of a 2fas file
+        passphrase: password of the 2fas file
+        only: optional set of (lowercased) service names; other services are dropped before being loaded.
+
     Raises:
         PermissionError
     """
     try:
-        dicts = _decrypt(encrypted, passphrase)
+        # the unfiltered list of dicts is not kept around, so secrets of other services can be freed right away:
+        dicts = select_by_name(_decrypt(encrypted, passphrase), only)
         return into_class(dicts, TwoFactorAuthDetails)
     except cryptography.exceptions.InvalidTag as e:
         # wrong passphrase!
@@ -2,12 +2,16 @@
 This file holds reusable types.
 """
 
+import json
+import operator
 import typing
 from typing import Optional
 
-from configuraptor import TypedConfig, asdict, asjson
+from configuraptor import TypedConfig
 from pyotp import TOTP
 
+from .instrumentation import span
+
 AnyDict = dict[str, typing.Any]
 
 
@@ -19,6 +23,7 @@ class OtpDetails(TypedConfig):
     link: Optional[str] = None
     tokenType: Optional[str] = None
     source: Optional[str] = None
+    issuer: Optional[str] = None
     label: Optional[str] = None
     account: Optional[str] = None
     digits: Optional[int] = None
@@ -50,6 +55,17 @@ class IconDetails(TypedConfig):
     iconCollection: IconCollectionDetails
 
 
+class GroupDetails(TypedConfig):
+    """
+    Fields of a group (folder) in a 2fas file.
+    """
+
+    id: str
+    name: Optional[str] = None
+    isExpanded: Optional[bool] = None
+    updatedAt: Optional[int] = None
+
+
 class TwoFactorAuthDetails(TypedConfig):
     """
     Fields of a service in a 2fas file.
@@ -62,7 +78,7 @@ class TwoFactorAuthDetails(TypedConfig):
     otp: Optional[OtpDetails] = None
     order: Optional[OrderDetails] = None
     icon: Optional[IconDetails] = None
-    groupId: Optional[str] = None  # todo: groups are currently not supported!
+    groupId: Optional[str] = None  # see GroupDetails
 
     _topt: Optional[TOTP] = None  # lazily loaded when calling .totp or .generate()
 
@@ -71,9 +87,12 @@ class TwoFactorAuthDetails(TypedConfig):
         """
         Get a TOTP instance for this service.
         """
-        if not self._topt:
-            self._topt = TOTP(self.secret)
-        return self._topt
+        # read (and write) the attribute once, so concurrent first calls can't see a half-initialized state.
+        # At worst, two threads both create an (equivalent) TOTP instance.
+        totp = self._topt
+        if totp is None:
+            totp = self._topt = TOTP(self.secret)
+        return totp
 
     def generate(self) -> str:
         """
@@ -93,13 +112,13 @@ class TwoFactorAuthDetails(TypedConfig):
         """
         Dump this object as a dictionary.
         """
-        return asdict(self, with_top_level_key=False, exclude_internals=2)
+        return field_extractor(type(self))(self)
 
     def as_json(self) -> str:
         """
         Dump this object as a JSON string.
         """
-        return asjson(self, with_top_level_key=False, indent=2, exclude_internals=2)
+        return json.dumps(self.as_dict(), indent=2)
 
     def __str__(self) -> str:
         """
@@ -117,8 +136,58 @@ class TwoFactorAuthDetails(TypedConfig):
 T_TypedConfig = typing.TypeVar("T_TypedConfig", bound=TypedConfig)
 
 
+def _nested_config(hint: typing.Any) -> Optional[typing.Type[TypedConfig]]:
+    """
+    Find the TypedConfig class in a type hint such as `Optional[OtpDetails]`.
+    """
+    for option in (hint, *typing.get_args(hint)):
+        if isinstance(option, type) and issubclass(option, TypedConfig):
+            return option
+    return None
+
+
+def field_names(klass: typing.Type[TypedConfig]) -> list[str]:
+    """
+    The (public) fields of 'klass', as dumped by `field_extractor`.
+    """
+    return [name for name in typing.get_type_hints(klass) if not name.startswith("_")]
+
+
+_extractors: dict[type, typing.Callable[[typing.Any], AnyDict]] = {}
+
+
+def field_extractor(klass: typing.Type[TypedConfig]) -> typing.Callable[[typing.Any], AnyDict]:
+    """
+    Build (once per class) a function that dumps an instance of 'klass' to a dict.
+
+    This gives the same result as configuraptor's `asdict(..., with_top_level_key=False, exclude_internals=2)`, \
+     but the fields are looked up from the type hints once instead of reflecting on every call.
+    """
+    if extractor := _extractors.get(klass):
+        return extractor
+
+    hints = typing.get_type_hints(klass)
+    names = field_names(klass)
+    nested = [(name, field_extractor(sub)) for name in names if (sub := _nested_config(hints[name]))]
+
+    # attrgetter only returns a tuple for multiple names:
+    getter = operator.attrgetter(*names) if len(names) > 1 else lambda obj: (getattr(obj, names[0]),)
+
+    def extract(obj: typing.Any) -> AnyDict:
+        data = dict(zip(names, getter(obj)))
+        for name, sub in nested:
+            if (value := data[name]) is not None:
+                data[name] = sub(value)
+        return data
+
+    # building twice (from multiple threads) is harmless, both extractors are the same:
+    _extractors[klass] = extract
+    return extract
+
+
 def into_class(entries: list[AnyDict], klass: typing.Type[T_TypedConfig]) -> list[T_TypedConfig]:
     """
     Helper to load a list of dicts into a list of Typed Config instances.
     """
-    return [klass.load(d) for d in entries]
+    with span("into_class", klass=klass.__name__, entries=len(entries)):
+        return [klass.load(d) for d in entries]
@@ -2,67 +2,381 @@
 This file contains the core functionality.
 """
 
+import contextlib
+import itertools
+import json
+import re
 import sys
+import threading
 import typing
 from collections import defaultdict
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional
 
 import pyjson5
 
+from ._index import IndexEntry, decrypt_indexed, index_path, read_index
 from ._security import decrypt, keyring_manager
-from ._types import TwoFactorAuthDetails, into_class
-from .utils import flatten, fuzzy_match
+from ._types import AnyDict, GroupDetails, TwoFactorAuthDetails, field_extractor, field_names, into_class
+from .instrumentation import span
+from .utils import flatten, fuzzy_match, normalize_names, select_by_name
 
 T_TwoFactorAuthDetails = typing.TypeVar("T_TwoFactorAuthDetails", bound=TwoFactorAuthDetails)
 
+IndexKey = typing.Hashable
 
-class TwoFactorStorage(typing.Generic[T_TwoFactorAuthDetails]):
+
+def _index_key(value: IndexKey) -> IndexKey:
     """
-    Container to make working with a collection of 2fas services easier.
+    Secondary indexes are case-insensitive.
     """
+    return value.lower() if isinstance(value, str) else value
+
+
+def _account(entry: TwoFactorAuthDetails) -> Optional[str]:
+    return entry.otp.account if entry.otp else None
+
+
+def _issuer(entry: TwoFactorAuthDetails) -> Optional[str]:
+    return entry.otp.issuer if entry.otp else None
+
+
+def _position(entry: TwoFactorAuthDetails) -> int:
+    return entry.order.position if entry.order else 0
+
+
+def _identity(entry: TwoFactorAuthDetails) -> tuple[str, str]:
+    # the same secret for the same account is the same service, even if it has been renamed
+    return (entry.secret or "").lower(), (_account(entry) or "").lower()
+
+
+REDACTED = "<redacted>"
+# the secret is also in the otpauth:// link:
+_LINK_SECRET = re.compile(r"(?<=[?&]secret=)[^&]*", re.IGNORECASE)
+
+
+def _redact(data: AnyDict) -> AnyDict:
+    if "secret" in data:
+        data["secret"] = REDACTED
+    if (otp := data.get("otp")) and otp.get("link"):
+        otp["link"] = _LINK_SECRET.sub(REDACTED, otp["link"])
+    return data
+
+
+@dataclass
+class MergeReport(typing.Generic[T_TwoFactorAuthDetails]):
+    """
+    Result of `TwoFactorStorage.merge()`.
+    """
+
+    added: list[T_TwoFactorAuthDetails] = field(default_factory=list)
+    # (old, new) pairs
+    replaced: list[tuple[T_TwoFactorAuthDetails, T_TwoFactorAuthDetails]] = field(default_factory=list)
+    # entries that were not merged, because a newer (or the same) version was already known
+    skipped: list[T_TwoFactorAuthDetails] = field(default_factory=list)
+
 
-    _multidict: defaultdict[str, list[T_TwoFactorAuthDetails]]
+class _StorageState(typing.Generic[T_TwoFactorAuthDetails]):
+    """
+    All data of a TwoFactorStorage.
+
+    Storages in concurrent mode never modify a state once it has been published, but replace it with an updated copy.
+    """
+
+    __slots__ = ("count", "group_names", "groups", "indexes", "multidict", "ordered")
+
+    multidict: defaultdict[str, list[T_TwoFactorAuthDetails]]
+    indexes: dict[str, defaultdict[IndexKey, list[T_TwoFactorAuthDetails]]]
+    ordered: list[T_TwoFactorAuthDetails]
+    groups: dict[str, GroupDetails]
+    group_names: dict[str, str]
     count: int
 
-    def __init__(self, _klass: typing.Type[T_TwoFactorAuthDetails] = None) -> None:
+    def __init__(self, index_names: typing.Iterable[str]) -> None:
+        """
+        Create an empty state with the given secondary indexes.
+        """
+        self.multidict = defaultdict(list)  # one name can map to multiple keys
+        self.indexes = {name: defaultdict(list) for name in index_names}
+        self.ordered = []  # sorted by order.position
+        self.groups = {}  # groupId -> group
+        self.group_names = {}  # lowercased group name -> groupId
+        self.count = 0
+
+    def copy(self) -> "_StorageState[T_TwoFactorAuthDetails]":
+        """
+        Copy the containers (not the entries themselves), so the copy can be modified without affecting this state.
+        """
+        new: _StorageState[T_TwoFactorAuthDetails] = _StorageState(())
+        new.multidict = defaultdict(list, {key: list(entries) for key, entries in self.multidict.items()})
+        new.indexes = {
+            name: defaultdict(list, {key: list(entries) for key, entries in index.items()})
+            for name, index in self.indexes.items()
+        }
+        new.ordered = list(self.ordered)
+        new.groups = dict(self.groups)
+        new.group_names = dict(self.group_names)
+        new.count = self.count
+        return new
+
+
+class TwoFactorStorage(typing.Generic[T_TwoFactorAuthDetails]):
+    """
+    Container to make working with a collection of 2fas services easier.
+
+    Writes (add, merge, add_groups) are serialized with a lock. Reads don't lock:
+    in concurrent mode, writers publish a new (copy-on-write) state, so readers in other threads always see
+     a consistent version. This makes every write O(n), so it is off by default.
+    """
+
+    # secondary (hash) indexes, maintained by `add()`: index name -> function to get the key of an entry.
+    # Subclasses can extend this to add their own indexes.
+    indexes: typing.ClassVar[dict[str, typing.Callable[[TwoFactorAuthDetails], IndexKey]]] = {
+        "group": lambda entry: entry.groupId,
+        "account": _account,
+        "issuer": _issuer,
+        "secret": lambda entry: entry.secret,
+        "identity": _identity,
+    }
+
+    concurrent: bool
+    _state: _StorageState[T_TwoFactorAuthDetails]
+    _lock: threading.Lock
+
+    def __init__(self, _klass: typing.Type[T_TwoFactorAuthDetails] = None, concurrent: bool = False) -> None:
         """
         Create a new instance, usually done by `new_auth_storage()`.
 
         Args:
             _klass: _klass is purely for annotation atm
+            concurrent: use copy-on-write, so the storage can be shared with threads that read from it.
         """
-        self._multidict = defaultdict(list)  # one name can map to multiple keys
-        self.count = 0
+        self.concurrent = concurrent
+        self._state = _StorageState(self.indexes)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _write(self) -> typing.Generator[_StorageState[T_TwoFactorAuthDetails], None, None]:
+        """
+        Get the state to modify; in concurrent mode, a copy that is published when the with-block ends without errors.
+        """
+        with self._lock:
+            state = self._state.copy() if self.concurrent else self._state
+            yield state
+            self._state = state
+
+    @property
+    def count(self) -> int:
+        """
+        The amount of items in this storage.
+        """
+        return self._state.count
 
     def __len__(self) -> int:
         """
         The length of the storage is the amount of items in it.
         """
-        return self.count
+        return self._state.count
 
     def __bool__(self) -> bool:
         """
         The storage is truthy if it has any items.
         """
-        return self.count > 0
+        return self._state.count > 0
+
+    def snapshot(self) -> "TwoFactorStorage[T_TwoFactorAuthDetails]":
+        """
+        Get an independent storage with the current version: later writes to either storage don't affect the other.
+
+        In concurrent mode this is O(1), since published states are never modified (the snapshot is concurrent too,
+         so writing to it copies first). Otherwise, the state is copied.
+        """
+        snapshot: TwoFactorStorage[T_TwoFactorAuthDetails] = type(self)(concurrent=True)
+        snapshot._state = self._state if self.concurrent else self._state.copy()
+        return snapshot
+
+    def _add_to(self, state: _StorageState[T_TwoFactorAuthDetails], entries: list[T_TwoFactorAuthDetails]) -> None:
+        indexes = [(state.indexes[name], get_key) for name, get_key in self.indexes.items()]
+
+        for entry in entries:
+            name = (entry.name or "").lower()
+            state.multidict[name].append(entry)
+            for index, get_key in indexes:
+                index[_index_key(get_key(entry))].append(entry)
+
+        # sort is stable and timsort only has to merge the new entries into the already sorted list:
+        state.ordered.extend(entries)
+        state.ordered.sort(key=_position)
+
+        state.count += len(entries)
 
     def add(self, entries: list[T_TwoFactorAuthDetails]) -> None:
         """
         Extend the storage with new items.
         """
+        with span("storage.add", entries=len(entries)), self._write() as state:
+            self._add_to(state, entries)
+
+    def _remove_from(self, state: _StorageState[T_TwoFactorAuthDetails], entries: list[T_TwoFactorAuthDetails]) -> None:
+        """
+        Remove entries from the storage (by identity) and from all of its indexes.
+
+        Only the buckets of the removed entries are rebuilt (+ the ordered list, once), so this is linear.
+        """
+        if not entries:
+            return
+
+        removed = {id(entry) for entry in entries}
+
+        def prune(mapping: defaultdict[typing.Any, list[T_TwoFactorAuthDetails]], keys: set[typing.Any]) -> None:
+            # every affected bucket is rebuilt once, no matter how many of its entries are removed
+            for key in keys:
+                if remaining := [entry for entry in mapping[key] if id(entry) not in removed]:
+                    mapping[key] = remaining
+                else:
+                    del mapping[key]
+
+        prune(state.multidict, {(entry.name or "").lower() for entry in entries})
+        for name, get_key in self.indexes.items():
+            prune(state.indexes[name], {_index_key(get_key(entry)) for entry in entries})
+
+        # the same object can be stored more than once, so count what is actually removed:
+        before = len(state.ordered)
+        state.ordered = [entry for entry in state.ordered if id(entry) not in removed]
+        state.count -= before - len(state.ordered)
+
+    def merge(self, entries: typing.Iterable[T_TwoFactorAuthDetails]) -> MergeReport[T_TwoFactorAuthDetails]:
+        """
+        Extend the storage with new items, without creating duplicates.
+
+        Entries with the same secret and account are considered the same service.
+        If a service is already known (or occurs multiple times in 'entries'), the version with the newest \
+         'updatedAt' is kept. Existing duplicates of a replaced service are removed as well.
+
+        Unlike `add()`, which simply appends, this is meant for combining (exports of) multiple vaults.
+        It uses the 'identity' hash index, so it runs in linear time.
+
+        Usage:
+            report = storage.merge(other_storage)
+            print(len(report.added), len(report.replaced), len(report.skipped))
+        """
+        report: MergeReport[T_TwoFactorAuthDetails] = MergeReport()
+
+        # dedupe the input itself first: newest version per identity wins
+        newest: dict[IndexKey, T_TwoFactorAuthDetails] = {}
         for entry in entries:
-            name = (entry.name or "").lower()
-            self._multidict[name].append(entry)
+            key = _index_key(_identity(entry))
+            if (known := newest.get(key)) is None:
+                newest[key] = entry
+            elif entry.updatedAt > known.updatedAt:
+                report.skipped.append(known)
+                newest[key] = entry
+            else:
+                report.skipped.append(entry)
+
+        with self._write() as state:
+            existing_index = state.indexes["identity"]
+            to_add: list[T_TwoFactorAuthDetails] = []
+            to_remove: list[T_TwoFactorAuthDetails] = []
+            for key, entry in newest.items():
+                if not (existing := existing_index.get(key)):
+                    report.added.append(entry)
+                    to_add.append(entry)
+                elif entry.updatedAt > max(old.updatedAt for old in existing):
+                    # dedupe by identity, in case the same object was added multiple times:
+                    existing = list({id(old): old for old in existing}.values())
+                    report.replaced.extend((old, entry) for old in existing)
+                    to_remove.extend(existing)
+                    to_add.append(entry)
+                else:
+                    report.skipped.append(entry)
+
+            self._remove_from(state, to_remove)
+            with span("storage.add", entries=len(to_add)):
+                self._add_to(state, to_add)
+
+        return report
+
+    def lookup(self, index: str, value: IndexKey) -> list[T_TwoFactorAuthDetails]:
+        """
+        Get all services with a specific (case-insensitive) value in one of the secondary indexes.
+
+        Usage:
+            storage.lookup("account", "alice@example.com")
+            storage.lookup("secret", "JBSWY3DPEHPK3PXP")
+
+        Raises:
+            KeyError if 'index' is not one of `indexes`.
+        """
+        return list(self._state.indexes[index].get(_index_key(value), []))
+
+    def by_account(self, account: str) -> list[T_TwoFactorAuthDetails]:
+        """
+        Get all services for an account (otp.account).
+        """
+        return self.lookup("account", account)
 
-        self.count += len(entries)
+    def by_issuer(self, issuer: str) -> list[T_TwoFactorAuthDetails]:
+        """
+        Get all services for an issuer (otp.issuer).
+        """
+        return self.lookup("issuer", issuer)
+
+    def by_secret(self, secret: str) -> list[T_TwoFactorAuthDetails]:
+        """
+        Get all services that share a secret.
+        """
+        return self.lookup("secret", secret)
+
+    def duplicates(self, index: str = "secret") -> dict[IndexKey, list[T_TwoFactorAuthDetails]]:
+        """
+        Find entries which share a value in one of the secondary indexes (by default: the same secret).
+
+        Entries without a value for the index (e.g. no account) are not considered duplicates.
+        """
+        return {key: list(entries) for key, entries in self._state.indexes[index].items() if key and len(entries) > 1}
+
+    def ordered(self) -> list[T_TwoFactorAuthDetails]:
+        """
+        Return a list of services, sorted by their order position (like in the app).
+        """
+        return list(self._state.ordered)
+
+    def add_groups(self, groups: list[GroupDetails]) -> None:
+        """
+        Register groups (folders), so services can be looked up by group name.
+        """
+        with self._write() as state:
+            for group in groups:
+                state.groups[group.id] = group
+                if group.name:
+                    state.group_names[group.name.lower()] = group.id
+
+    def groups(self) -> list[GroupDetails]:
+        """
+        Return a list of known groups.
+        """
+        return list(self._state.groups.values())
+
+    def group(self, group: str) -> "TwoFactorStorage[T_TwoFactorAuthDetails]":
+        """
+        Create a new storage object with only the services in a group (by name or id).
+
+        This uses the group index, so it does not have to loop through all services.
+        """
+        state = self._state
+        # resolve a group name (case-insensitive) or id to a group id:
+        group_id = state.group_names.get(group.lower(), group)
+        entries = state.indexes["group"].get(_index_key(group_id), [])
+        return new_auth_storage(list(entries), list(state.groups.values()), storage_class=type(self))
 
     def __getitem__(self, item: str) -> "list[T_TwoFactorAuthDetails]":
         """
         Get a service via the class[property] syntax.
         """
-        #
-        return self._multidict[item.lower()]
+        # .get instead of [] so reading never modifies the (defaultdict) state
+        return list(self._state.multidict.get(item.lower(), []))
 
     def keys(self) -> list[str]:
         """
@@ -71,7 +385,7 @@ class TwoFactorStorage(typing.Generic[T_TwoFactorAuthDetails]):
         Usage:
             storage.keys()
         """
-        return list(self._multidict.keys())
+        return list(self._state.multidict.keys())
 
     def items(self) -> typing.Generator[tuple[str, list[T_TwoFactorAuthDetails]], None, None]:
         """
@@ -81,14 +395,18 @@ class TwoFactorStorage(typing.Generic[T_TwoFactorAuthDetails]):
             for key, value in storage.items(): ...
             # (like dict.items())
         """
-        yield from self._multidict.items()
+        yield from list(self._state.multidict.items())
 
-    def _fuzzy_find(self, find: typing.Optional[str], fuzz_threshold: int) -> list[T_TwoFactorAuthDetails]:
+    @staticmethod
+    def _fuzzy_find(
+        state: _StorageState[T_TwoFactorAuthDetails], find: typing.Optional[str], fuzz_threshold: int
+    ) -> list[T_TwoFactorAuthDetails]:
+        all_entries = flatten(list(state.multidict.values()))
         if not find:
             # don't loop
-            return list(self)
+            return all_entries
 
-        all_items = self._multidict.items()
+        all_items = state.multidict.items()
 
         find = find.lower()
         # if nothing found exactly, try again but fuzzy (could be slower)
@@ -107,30 +425,110 @@ class TwoFactorStorage(typing.Generic[T_TwoFactorAuthDetails]):
         return [
             # search in value instead
             v
-            for v in list(self)
+            for v in all_entries
             if fuzzy_match(repr(v).lower(), find) > fuzz_threshold
         ]
 
-    def generate(self) -> list[tuple[str, str]]:
+    def generate(self, group: Optional[str] = None) -> list[tuple[str, str]]:
         """
-        Create TOTP codes for all services in this storage.
+        Create TOTP codes for all services in this storage (or only the ones in 'group').
         """
-        return [(_.name, _.generate()) for _ in self]
+        if group is not None:
+            return self.group(group).generate()
+
+        state = self._state
+        with span("storage.generate", entries=state.count):
+            return [(_.name, _.generate()) for _ in itertools.chain.from_iterable(state.multidict.values())]
 
     def find(
-        self, target: Optional[str] = None, fuzz_threshold: int = 75
+        self, target: Optional[str] = None, fuzz_threshold: int = 75, group: Optional[str] = None
     ) -> "TwoFactorStorage[T_TwoFactorAuthDetails]":
         """
         Create a new storage object with a subset of items in this storage, filtered by the search query in 'target'.
 
         First, an exact search is tried and if that fails, fuzzy matching is applied.
+        If 'group' (name or id) is passed, only services in that group are searched.
         """
+        if group is not None:
+            return self.group(group).find(target, fuzz_threshold)
+
+        state = self._state
+        groups = list(state.groups.values())
         target = (target or "").lower()
-        # first try exact match:
-        if items := self._multidict.get(target):
-            return new_auth_storage(items)
-        # else: fuzzy match:
-        return new_auth_storage(self._fuzzy_find(target, fuzz_threshold))
+        with span("storage.find", entries=state.count) as phase:
+            # first try exact match:
+            if items := state.multidict.get(target):
+                phase.set(exact=True, found=len(items))
+                return new_auth_storage(list(items), groups, storage_class=type(self))
+            # else: fuzzy match:
+            found = self._fuzzy_find(state, target, fuzz_threshold)
+            phase.set(exact=False, found=len(found))
+            return new_auth_storage(found, groups, storage_class=type(self))
+
+    def export(
+        self,
+        fp: typing.TextIO,
+        fmt: typing.Literal["ndjson", "json"] = "ndjson",
+        fields: typing.Iterable[str] = None,
+        redact: bool = False,
+    ) -> int:
+        """
+        Stream all services to a file object, as newline-delimited JSON or as one JSON array.
+
+        Each entry is dumped like `as_dict()` and written right away, so memory use does not grow with the storage.
+
+        Args:
+            fp: (text) file object to write to
+            fmt: 'ndjson' (one service per line) or 'json' (an array)
+            fields: only include these (top-level) fields, e.g. ['name', 'otp']
+            redact: replace secrets (also in the otpauth link) with '<redacted>'
+
+        Returns:
+            The amount of exported services.
+
+        Raises:
+            ValueError on an unknown format or field (before anything is written).
+
+        Usage:
+            with open("services.ndjson", "w") as f:
+                storage.export(f, fields=["name", "otp"], redact=True)
+        """
+        if fmt not in ("ndjson", "json"):
+            raise ValueError(f"Unknown export format '{fmt}', choose 'ndjson' or 'json'.")
+
+        state = self._state
+        selected = list(fields) if fields is not None else None
+        if selected is not None:
+            # check before writing anything, so an invalid field doesn't leave a truncated file:
+            classes: set[type[TwoFactorAuthDetails]] = {
+                type(entry) for entry in itertools.chain.from_iterable(state.multidict.values())
+            }
+            known = {name for klass in classes or {TwoFactorAuthDetails} for name in field_names(klass)}
+            if unknown := [name for name in selected if name not in known]:
+                raise ValueError(f"Unknown field(s) for export: {', '.join(unknown)}.")
+
+        count = 0
+        with span("storage.export", entries=state.count, fmt=fmt):
+            if fmt == "json":
+                fp.write("[")
+
+            for entry in itertools.chain.from_iterable(state.multidict.values()):
+                data = field_extractor(type(entry))(entry)
+                if redact:
+                    data = _redact(data)
+                if selected is not None:
+                    data = {key: data[key] for key in selected}
+
+                if fmt == "ndjson":
+                    fp.write(json.dumps(data) + "\n")
+                else:
+                    fp.write((",\n" if count else "\n") + json.dumps(data))
+                count += 1
+
+            if fmt == "json":
+                fp.write("\n]\n")
+
+        return count
 
     def all(self) -> list[T_TwoFactorAuthDetails]:
         """
@@ -142,21 +540,34 @@ class TwoFactorStorage(typing.Generic[T_TwoFactorAuthDetails]):
         """
         Allows for-looping through this storage.
         """
-        for entries in self._multidict.values():
+        # the state is read once, so the loop is not affected by (concurrent) writes
+        for entries in list(self._state.multidict.values()):
             yield from entries
 
     def __repr__(self) -> str:
         """
         Representation for repr().
         """
-        return f"<TwoFactorStorage with {len(self._multidict)} keys and {self.count} entries>"
+        state = self._state
+        return f"<TwoFactorStorage with {len(state.multidict)} keys and {state.count} entries>"
 
 
-def new_auth_storage(initial_items: list[T_TwoFactorAuthDetails] = None) -> TwoFactorStorage[T_TwoFactorAuthDetails]:
+def new_auth_storage(
+    initial_items: list[T_TwoFactorAuthDetails] = None,
+    groups: list[GroupDetails] = None,
+    concurrent: bool = False,
+    storage_class: typing.Type[TwoFactorStorage[T_TwoFactorAuthDetails]] = TwoFactorStorage,
+) -> TwoFactorStorage[T_TwoFactorAuthDetails]:
     """
-    Create an instance of TwoFactorStorage and maybe load some items into it.
+    Create an instance of TwoFactorStorage and maybe load some items (and groups) into it.
+
+    Use concurrent=True for a (copy-on-write) storage that is shared between threads.
+    Pass 'storage_class' to create a subclass (e.g. one with extra indexes) instead.
     """
-    storage: TwoFactorStorage[T_TwoFactorAuthDetails] = TwoFactorStorage()
+    storage = storage_class(concurrent=concurrent)
+
+    if groups:
+        storage.add_groups(groups)
 
     if initial_items:
         storage.add(initial_items)
@@ -164,8 +575,50 @@ def new_auth_storage(initial_items: list[T_TwoFactorAuthDetails] = None) -> TwoF
     return storage
 
 
+R = typing.TypeVar("R")
+
+
+def _with_passphrase(
+    filename: str | Path, attempt: typing.Callable[[str], R], _max_retries: int = 0, passphrase: Optional[str] = None
+) -> R:
+    """
+    Call 'attempt' with the passphrase for 'filename', via the passphrase argument or the keyring (or by querying user).
+
+    If the passphrase from the keyring (or user) is invalid, it is removed from the keyring and the user is asked again.
+
+    Raises:
+         PermissionError on invalid password.
+    """
+    if passphrase is not None:
+        # could raise PermissionError
+        return attempt(passphrase)
+
+    retries = 0
+    while True:
+        with span("keyring.retrieve_credentials"):
+            password = keyring_manager.retrieve_credentials(str(filename))
+        if not password:
+            with span("keyring.save_credentials"):
+                password = keyring_manager.save_credentials(str(filename))
+
+        try:
+            return attempt(password)
+        except PermissionError as e:
+            retries += 1  # only really useful for pytest
+            print(e, file=sys.stderr)
+            with span("keyring.delete_credentials"):
+                keyring_manager.delete_credentials(str(filename))
+
+            if _max_retries and retries > _max_retries:
+                raise e
+
+
 def load_services(
-    filename: str | Path, _max_retries: int = 0, passphrase: Optional[str] = None
+    filename: str | Path,
+    _max_retries: int = 0,
+    passphrase: Optional[str] = None,
+    only: Optional[str | typing.Iterable[str]] = None,
+    use_index: bool = False,
 ) -> TwoFactorStorage[TwoFactorAuthDetails] | None:
     """
     Given a 2fas file, try to decrypt it (via stored password in keyring or by querying user) \
@@ -176,6 +629,10 @@ def load_services(
          _max_retries: how many password guesses are allowed? (default = unlimited)
          passphrase: password for the supplied 2fas file; leave empty to query the user.
             Note: when using the passphrase option, _max_retries is ignored and the keyring is not used.
+         only: service name (or names) to load, matched exactly and case-insensitively.
+            Other services are skipped before being loaded into TwoFactorAuthDetails instances.
+         use_index: use (and create) a sidecar index next to an encrypted 2fas file,
+            so 'only' lookups don't have to parse the whole file.
 
     Returns:
         A TwoFactorStorage instance, or None if e.g. the requested .2fas file does not exist.
@@ -188,42 +645,79 @@ def load_services(
     if not filepath.exists():
         return None
 
-    with filepath.open() as f:
-        data_raw = f.read()
-        data = pyjson5.loads(data_raw)
+    with span("load_services", file=str(filepath)) as phase:
+        storage = _load_services(filename, filepath, _max_retries, passphrase, only, use_index)
+        phase.set(entries=len(storage))
+        return storage
+
 
-    storage: TwoFactorStorage[TwoFactorAuthDetails] = new_auth_storage()
+def _load_services(
+    filename: str | Path,
+    filepath: Path,
+    _max_retries: int,
+    passphrase: Optional[str],
+    only: Optional[str | typing.Iterable[str]],
+    use_index: bool,
+) -> TwoFactorStorage[TwoFactorAuthDetails]:
+    with span("read") as phase:
+        data_raw = filepath.read_bytes()
+        phase.set(bytes=len(data_raw))
+
+    with span("parse", bytes=len(data_raw)):
+        data = pyjson5.loads(data_raw.decode())
+
+    groups = into_class(data.get("groups") or [], GroupDetails)
+    storage: TwoFactorStorage[TwoFactorAuthDetails] = new_auth_storage(groups=groups)
+    names = normalize_names(only)
 
     if decrypted := data["services"]:
-        services = into_class(decrypted, TwoFactorAuthDetails)
+        services = into_class(select_by_name(decrypted, names), TwoFactorAuthDetails)
         storage.add(services)
         return storage
 
     encrypted = data["servicesEncrypted"]
 
-    if passphrase is not None:
-        # could raise PermissionError
-        entries = decrypt(encrypted, passphrase)
-        storage.add(entries)
-        return storage
-    else:
-        retries = 0
-        while True:
-            # fmt: off
-            password = (
-                keyring_manager.retrieve_credentials(str(filename))
-                or keyring_manager.save_credentials(str(filename))
-            )
-            # fmt: on
-
-            try:
-                entries = decrypt(encrypted, password)
-                storage.add(entries)
-                return storage
-            except PermissionError as e:
-                retries += 1  # only really useful for pytest
-                print(e, file=sys.stderr)
-                keyring_manager.delete_credentials(str(filename))
+    def attempt(password: str) -> list[TwoFactorAuthDetails]:
+        if use_index:
+            return decrypt_indexed(filepath, data_raw, encrypted, password, only=names)
+        return decrypt(encrypted, password, only=names)
+
+    storage.add(_with_passphrase(filename, attempt, _max_retries, passphrase))
+    return storage
+
+
+def load_service_names(
+    filename: str | Path, _max_retries: int = 0, passphrase: Optional[str] = None
+) -> list[str] | None:
+    """
+    Get the (lowercased) names of the services in a 2fas file, like `load_services(...).keys()`.
+
+    For encrypted files, the sidecar index is used (and created if missing or outdated),
+     so after the first call the services don't have to be decrypted and parsed just to list them.
+
+    Args:
+         filename: Path to a .2fas file
+         _max_retries: how many password guesses are allowed? (default = unlimited)
+         passphrase: password for the supplied 2fas file; leave empty to query the user.
+
+    Returns:
+        A list of service names, or None if the requested .2fas file does not exist.
+
+    Raises:
+         PermissionError on invalid password.
+    """
+    filepath = Path(filename).expanduser()
+
+    if not filepath.exists():
+        return None
+
+    if index_path(filepath).exists():
+
+        def attempt(password: str) -> list[IndexEntry] | None:
+            return read_index(filepath, password)
+
+        if (index := _with_passphrase(filename, attempt, _max_retries, passphrase)) is not None:
+            return list(dict.fromkeys(entry.name.lower() for entry in index))
 
-                if _max_retries and retries > _max_retries:
-                    raise e
+    storage = load_services(filepath, _max_retries, passphrase, use_index=True)
+    return storage.keys() if storage is not None else None
@@ -0,0 +1,375 @@
+"""
+This file contains a long-running local TOTP service, so scripts don't have to load (and decrypt) a vault per code.
+
+The service loads a .2fas file once, keeps it in memory and answers requests over a Unix socket.
+It reloads the file when it changes.
+
+Protocol: every line sent to the socket is a JSON list of requests, the service answers with one line containing
+ a JSON list of results (in the same order). Multiple lookups in one line only cost one round-trip.
+
+    -> [{"op": "generate", "target": "github"}, {"op": "find", "target": "gmail", "group": "Work"}, {"op": "keys"}]
+    <- [{"ok": true, "codes": [["GitHub", "123456"]]}, {"ok": true, "services": [...]}, {"ok": true, "keys": [...]}]
+
+Usage:
+    python -m lib2fas.daemon /path/to/file.2fas [--socket /path/to/socket]
+
+    with TotpClient() as client:
+        github, gmail = client.generate("github", "gmail")
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+import typing
+from pathlib import Path
+from typing import Optional
+
+from ._security import keyring_manager
+from ._types import AnyDict, TwoFactorAuthDetails
+from .core import TwoFactorStorage, load_services
+from .instrumentation import span
+
+
+def default_socket_path() -> Path:
+    """
+    Per-user socket location: in $XDG_RUNTIME_DIR if available, otherwise in a private directory in the temp dir.
+    """
+    if runtime_dir := os.getenv("XDG_RUNTIME_DIR"):
+        return Path(runtime_dir) / "lib2fas.sock"
+    return Path(tempfile.gettempdir()) / f"lib2fas-{os.getuid()}" / "lib2fas.sock"
+
+
+def _private_dir(directory: Path) -> None:
+    """
+    Create a directory that only the current user can access, or check that an existing one is.
+
+    The temp dir is world-writable, so otherwise someone else could create (and own) the directory first.
+
+    Raises:
+        PermissionError if the directory exists but belongs to someone else or is accessible by others.
+    """
+    directory.mkdir(mode=0o700, exist_ok=True)
+    info = directory.lstat()
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"'{directory}' should be a directory that only the current user can access.")
+
+
+def _remove_stale_socket(path: Path) -> None:
+    """
+    Remove a socket file left behind by a server that is no longer running.
+
+    Raises:
+        FileExistsError if 'path' is not a socket or another server is still listening on it.
+    """
+    try:
+        info = path.lstat()
+    except FileNotFoundError:
+        return
+
+    if not stat.S_ISSOCK(info.st_mode):
+        raise FileExistsError(f"'{path}' already exists and is not a socket.")
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+    except ConnectionRefusedError:
+        path.unlink()
+        return
+    finally:
+        probe.close()
+
+    raise FileExistsError(f"Another server is already listening on '{path}'.")
+
+
+def _summary(entry: TwoFactorAuthDetails) -> AnyDict:
+    """
+    Public info about a service (no secrets are sent over the socket, except for the generated codes).
+    """
+    return {
+        "name": entry.name,
+        "account": entry.otp.account if entry.otp else None,
+        "issuer": entry.otp.issuer if entry.otp else None,
+        "groupId": entry.groupId,
+    }
+
+
+class TotpService:
+    """
+    Keeps a TwoFactorStorage for one .2fas file loaded and answers (batches of) requests.
+    """
+
+    filepath: Path
+    _storage: TwoFactorStorage[TwoFactorAuthDetails]
+    _version: tuple[int, int]
+
+    def __init__(self, filename: str | Path, passphrase: Optional[str] = None, _max_retries: int = 0) -> None:
+        """
+        Load the file right away, which could ask for the passphrase (if it's not passed and not in the keyring).
+
+        Reloads happen in request threads, so they never ask: they use the passphrase from the first load
+         (passed or found in the keyring afterwards). If that's not valid anymore, the previous version is kept.
+
+        Raises:
+            FileNotFoundError if the file does not exist.
+            PermissionError on invalid password.
+        """
+        self.filepath = Path(filename).expanduser()
+        self._reload_lock = threading.Lock()
+        self._failed_version: Optional[tuple[int, int]] = None
+        self._load(passphrase, _max_retries)
+
+        if passphrase is None:
+            # the keyring now holds the passphrase that worked (if the file is encrypted);
+            # an empty passphrase on reload fails (instead of prompting) for encrypted files and is unused otherwise.
+            passphrase = keyring_manager.retrieve_credentials(str(self.filepath)) or ""
+        self.passphrase = passphrase
+
+    def _stat(self) -> tuple[int, int]:
+        info = self.filepath.stat()
+        return info.st_mtime_ns, info.st_size
+
+    def _load(self, passphrase: Optional[str], _max_retries: int = 0) -> None:
+        version = self._stat()  # raises FileNotFoundError for a missing file, so load_services won't return None
+        storage = typing.cast(
+            TwoFactorStorage[TwoFactorAuthDetails], load_services(self.filepath, _max_retries, passphrase)
+        )
+
+        storage.concurrent = True  # shared by the request threads
+        self._storage, self._version = storage, version
+
+    @property
+    def storage(self) -> TwoFactorStorage[TwoFactorAuthDetails]:
+        """
+        The loaded storage, reloaded first if the file changed.
+
+        If reloading fails (e.g. the file is being written), the previous version is kept
+         until the file changes again.
+        """
+        try:
+            version = self._stat()
+        except OSError:
+            return self._storage
+
+        if version not in (self._version, self._failed_version):
+            with self._reload_lock:
+                try:
+                    # another thread could have reloaded (or failed to) in the meantime:
+                    if (version := self._stat()) not in (self._version, self._failed_version):
+                        with span("daemon.reload", file=str(self.filepath)):
+                            self._load(self.passphrase)
+                except Exception as e:  # keep serving the old version, whatever is wrong with the new one
+                    self._failed_version = version  # don't retry until the file changes again
+                    print(f"Reloading {self.filepath} failed: {e}", file=sys.stderr)
+
+        return self._storage
+
+    def handle(self, requests: list[AnyDict]) -> list[AnyDict]:
+        """
+        Answer a batch of requests, all against the same version of the storage.
+        """
+        with span("daemon.handle", requests=len(requests)):
+            storage = self.storage.snapshot()
+            results = []
+            for request in requests:
+                try:
+                    results.append(self._handle_one(storage, request))
+                except Exception as e:  # one bad request should not fail the whole batch (or connection)
+                    results.append({"ok": False, "error": str(e)})
+            return results
+
+    @staticmethod
+    def _handle_one(storage: TwoFactorStorage[TwoFactorAuthDetails], request: typing.Any) -> AnyDict:
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "A request should be an object."}
+
+        op = request.get("op")
+        target = request.get("target")
+        group = request.get("group")
+        fuzz_threshold = request.get("fuzz_threshold", 75)
+
+        if op == "generate":
+            return {"ok": True, "codes": storage.find(target, fuzz_threshold, group=group).generate()}
+        elif op == "find":
+            found = storage.find(target, fuzz_threshold, group=group)
+            return {"ok": True, "services": [_summary(entry) for entry in found]}
+        elif op == "keys":
+            return {"ok": True, "keys": storage.keys()}
+
+        return {"ok": False, "error": f"Unknown op '{op}', choose 'generate', 'find' or 'keys'."}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one connection: one line of requests in, one line of results out, until the client disconnects.
+    """
+
+    server: "TotpServer"
+
+    def handle(self) -> None:
+        """
+        Answer every line sent by the client.
+        """
+        for line in self.rfile:
+            try:
+                requests = json.loads(line)
+            except ValueError:
+                results = [{"ok": False, "error": "Invalid JSON."}]
+            else:
+                results = self.server.service.handle(requests if isinstance(requests, list) else [requests])
+
+            self.wfile.write(json.dumps(results).encode() + b"\n")
+            self.wfile.flush()
+
+
+class TotpServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Unix socket server for a TotpService, only accessible by the current user.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, service: TotpService, socket_path: Optional[str | Path] = None) -> None:
+        """
+        Bind to 'socket_path' (default: `default_socket_path()`), replacing a stale socket file.
+
+        Raises:
+            FileExistsError if something else is at 'socket_path' or another server is listening on it.
+            PermissionError if the directory of the default socket path is not private.
+        """
+        self.service = service
+        if socket_path is None:
+            socket_path = default_socket_path()
+            _private_dir(socket_path.parent)
+
+        self.socket_path = Path(socket_path)
+        _remove_stale_socket(self.socket_path)
+
+        old_umask = os.umask(0o177)  # socket file is created with 0600
+        try:
+            super().__init__(str(self.socket_path), _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self) -> None:
+        """
+        Also remove the socket file.
+        """
+        super().server_close()
+        self.socket_path.unlink(missing_ok=True)
+
+
+def serve(
+    filename: str | Path,
+    socket_path: Optional[str | Path] = None,
+    passphrase: Optional[str] = None,
+    _max_retries: int = 0,
+) -> TotpServer:
+    """
+    Load a .2fas file and create a server for it; call `.serve_forever()` on the result to start answering.
+    """
+    return TotpServer(TotpService(filename, passphrase, _max_retries), socket_path)
+
+
+class TotpClient:
+    """
+    Client for a running TotpServer, keeps its connection open between requests.
+    """
+
+    def __init__(self, socket_path: Optional[str | Path] = None, timeout: float = 5.0) -> None:
+        """
+        Connect to the server at 'socket_path' (default: `default_socket_path()`).
+
+        Raises:
+            PermissionError if the socket belongs to another user (who would receive the requests).
+        """
+        path = Path(socket_path or default_socket_path())
+        if path.stat().st_uid != os.getuid():
+            raise PermissionError(f"Socket '{path}' belongs to another user.")
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(str(path))
+        self._file = self._socket.makefile("rwb")
+
+    def request(self, *requests: AnyDict) -> list[AnyDict]:
+        """
+        Send a batch of raw requests in one round-trip and get the raw results.
+        """
+        self._file.write(json.dumps(requests).encode() + b"\n")
+        self._file.flush()
+        results: list[AnyDict] = json.loads(self._file.readline())
+        return results
+
+    @staticmethod
+    def _unwrap(result: AnyDict, key: str) -> typing.Any:
+        if not result.get("ok"):
+            raise RuntimeError(result.get("error", "Unknown error"))
+        return result[key]
+
+    def generate(self, *targets: str, group: Optional[str] = None) -> list[list[tuple[str, str]]]:
+        """
+        Get the codes for one or more searches (see `TwoFactorStorage.find`), in one round-trip.
+
+        Without targets, codes for all services are returned.
+        """
+        results = self.request(*[{"op": "generate", "target": target, "group": group} for target in targets or [None]])
+        return [[(name, code) for name, code in self._unwrap(result, "codes")] for result in results]
+
+    def find(self, *targets: str, group: Optional[str] = None) -> list[list[AnyDict]]:
+        """
+        Get name, account, issuer and groupId of the services matching one or more searches, in one round-trip.
+        """
+        results = self.request(*[{"op": "find", "target": target, "group": group} for target in targets])
+        return [self._unwrap(result, "services") for result in results]
+
+    def keys(self) -> list[str]:
+        """
+        Get the names of all services.
+        """
+        keys: list[str] = self._unwrap(self.request({"op": "keys"})[0], "keys")
+        return keys
+
+    def close(self) -> None:
+        """
+        Close the connection.
+        """
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self) -> "TotpClient":
+        """
+        Use as a context manager to close the connection afterwards.
+        """
+        return self
+
+    def __exit__(self, *_: typing.Any) -> None:
+        """
+        Close the connection.
+        """
+        self.close()
+
+
+def main(args: list[str] = None) -> None:  # pragma: no cover
+    """
+    Command line entrypoint: load a .2fas file and serve it until interrupted.
+    """
+    parser = argparse.ArgumentParser(prog="python -m lib2fas.daemon", description=__doc__.split("\n\n")[0])
+    parser.add_argument("filename", help="path to a .2fas file")
+    parser.add_argument("--socket", default=None, help=f"socket path (default: {default_socket_path()})")
+    options = parser.parse_args(args)
+
+    with serve(options.filename, options.socket) as server:
+        print(f"Serving {options.filename} on {server.socket_path}", file=sys.stderr)
+        with contextlib.suppress(KeyboardInterrupt):
+            server.serve_forever()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,172 @@
+"""
+This file contains optional instrumentation hooks, to see where the time in e.g. `load_services` goes.
+
+Register an observer (any callable that accepts a PhaseEvent) to receive the duration and size of every phase:
+
+    from lib2fas import instrumentation
+
+    instrumentation.add_observer(print)
+    # or, for OpenTelemetry:
+    instrumentation.add_observer(instrumentation.OpenTelemetryObserver(trace.get_tracer("lib2fas")))
+
+When no observers are registered, `span()` returns a shared no-op object, so the hooks cost (almost) nothing.
+"""
+
+import contextlib
+import time
+import typing
+
+Attributes = dict[str, str | int | float | bool]
+
+
+class PhaseEvent(typing.NamedTuple):
+    """
+    A finished phase: name, start time (ns since epoch), duration (ns) and extra info such as sizes.
+    """
+
+    name: str
+    start_ns: int
+    duration_ns: int
+    attributes: Attributes
+
+    @property
+    def duration(self) -> float:
+        """
+        Duration in seconds.
+        """
+        return self.duration_ns / 1e9
+
+
+Observer = typing.Callable[[PhaseEvent], None]
+
+_observers: list[Observer] = []
+
+
+def add_observer(observer: Observer) -> None:
+    """
+    Start sending phase events to 'observer'.
+    """
+    _observers.append(observer)
+
+
+def remove_observer(observer: Observer) -> None:
+    """
+    Stop sending phase events to 'observer'.
+    """
+    with contextlib.suppress(ValueError):
+        _observers.remove(observer)
+
+
+@contextlib.contextmanager
+def observing(observer: Observer) -> typing.Generator[Observer, None, None]:
+    """
+    Register an observer for the duration of a with-block.
+    """
+    add_observer(observer)
+    try:
+        yield observer
+    finally:
+        remove_observer(observer)
+
+
+class _Span:
+    """
+    Times a phase and reports it to the observers on exit.
+    """
+
+    __slots__ = ("attributes", "name", "start_ns", "started")
+
+    def __init__(self, name: str, attributes: Attributes) -> None:
+        """
+        Prepare a span, timing starts when entering the with-block.
+        """
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = 0
+        self.started = 0
+
+    def set(self, **attributes: str | int | float | bool) -> None:
+        """
+        Add attributes that are only known during the phase (e.g. the amount of entries).
+        """
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "_Span":
+        """
+        Start timing.
+        """
+        self.start_ns = time.time_ns()
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_: typing.Any) -> None:
+        """
+        Stop timing and notify the observers (also when the phase raised an exception).
+        """
+        event = PhaseEvent(self.name, self.start_ns, time.perf_counter_ns() - self.started, self.attributes)
+        for observer in list(_observers):
+            observer(event)
+
+
+class _NoopSpan(_Span):
+    """
+    Used when nobody is observing.
+    """
+
+    def set(self, **_: str | int | float | bool) -> None:
+        """
+        Ignore attributes.
+        """
+
+    def __enter__(self) -> "_Span":
+        """
+        Nothing to time.
+        """
+        return self
+
+    def __exit__(self, *_: typing.Any) -> None:
+        """
+        Nothing to report.
+        """
+
+
+_NOOP = _NoopSpan("noop", {})
+
+
+def span(name: str, **attributes: str | int | float | bool) -> _Span:
+    """
+    Time the phase 'name' in a with-block.
+
+    Usage:
+        with span("read", file=str(filepath)) as phase:
+            data = filepath.read_bytes()
+            phase.set(bytes=len(data))
+    """
+    if not _observers:
+        return _NOOP
+    return _Span(name, attributes)
+
+
+class OpenTelemetryObserver:
+    """
+    Observer that turns phase events into OpenTelemetry spans.
+
+    opentelemetry is not a dependency of lib2fas: pass any tracer with the OpenTelemetry `start_span` API.
+    Since events are reported when a phase ends, the spans are not nested but share the current (parent) context.
+    """
+
+    def __init__(self, tracer: typing.Any, prefix: str = "lib2fas.") -> None:
+        """
+        Setup with an OpenTelemetry tracer, e.g. `trace.get_tracer("lib2fas")`.
+        """
+        self.tracer = tracer
+        self.prefix = prefix
+
+    def __call__(self, event: PhaseEvent) -> None:
+        """
+        Record one phase as a span, with its real start and end times.
+        """
+        otel_span = self.tracer.start_span(
+            f"{self.prefix}{event.name}", start_time=event.start_ns, attributes=event.attributes
+        )
+        otel_span.end(end_time=event.start_ns + event.duration_ns)
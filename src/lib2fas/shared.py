@@ -0,0 +1,300 @@
+"""
+This file contains a read-only, shared-memory version of TwoFactorStorage, for pre-fork multi-process servers.
+
+The parent process loads the vault once and publishes it into a `multiprocessing.shared_memory` segment.
+Workers attach to that segment instead of loading (and decrypting) the vault themselves:
+ the data is not copied per worker, and TwoFactorAuthDetails instances are only built for the services a lookup returns.
+
+Usage:
+    # parent, before forking:
+    vault = publish(load_services("/path/to/file.2fas"))
+    # worker:
+    shared = SharedVault.attach(vault.name)
+    shared["github"], shared.find("githbu"), shared.generate()
+    # parent, on shutdown:
+    vault.unlink()
+
+Layout of the segment (little-endian):
+    header: magic, amount of records, amount of keys, offset and length of the groups (JSON)
+    records: per service, offset and length of its name, secret and JSON (as_dict), grouped by name
+    keys: per lowercased name (sorted, for binary search), its offset and length + the range of records with that name
+    data: the UTF-8 encoded strings the tables point to
+"""
+
+import json
+import struct
+import sys
+import typing
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+from pyotp import TOTP
+
+from ._types import GroupDetails, TwoFactorAuthDetails, field_extractor, into_class
+from .core import TwoFactorStorage, new_auth_storage
+from .instrumentation import span
+from .utils import fuzzy_match
+
+MAGIC = b"2FASSHM1"
+_HEADER = struct.Struct("<8sIIII")  # magic, records, keys, groups offset, groups length
+_RECORD = struct.Struct("<IIIIII")  # name offset/length, secret offset/length, json offset/length
+_KEY = struct.Struct("<IIII")  # key offset/length, first record, amount of records
+
+
+def _pack(storage: TwoFactorStorage[TwoFactorAuthDetails]) -> bytes:
+    """
+    Serialize a storage into the shared memory layout.
+    """
+    items = list(storage.items())
+    entries = [entry for _, group in items for entry in group]
+
+    data = bytearray()
+    data_start = _HEADER.size + _RECORD.size * len(entries) + _KEY.size * len(items)
+
+    def store(value: str) -> tuple[int, int]:
+        encoded = value.encode()
+        offset = data_start + len(data)
+        data.extend(encoded)
+        return offset, len(encoded)
+
+    records = bytearray()
+    for entry in entries:
+        name, secret, details = entry.name or "", entry.secret or "", json.dumps(entry.as_dict())
+        records += _RECORD.pack(*store(name), *store(secret), *store(details))
+
+    keys = []
+    first = 0
+    for key, group in items:
+        keys.append((key.encode(), first, len(group)))
+        first += len(group)
+
+    key_table = bytearray()
+    for key_bytes, first, amount in sorted(keys):
+        key_offset = data_start + len(data)
+        data.extend(key_bytes)
+        key_table += _KEY.pack(key_offset, len(key_bytes), first, amount)
+
+    groups = store(json.dumps([field_extractor(GroupDetails)(group) for group in storage.groups()]))
+
+    header = _HEADER.pack(MAGIC, len(entries), len(items), *groups)
+    return bytes(header + records + key_table + data)
+
+
+class SharedVault:
+    """
+    Read-only view on a storage published in shared memory, with the lookups of TwoFactorStorage.
+
+    Lookups (`find`, `__getitem__`) return real TwoFactorAuthDetails, built from the shared data on demand.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool = False) -> None:
+        """
+        Use `publish()` or `SharedVault.attach()` instead.
+
+        Raises:
+            ValueError if the segment does not contain a published vault.
+        """
+        if shm.buf is None or shm.size < _HEADER.size:
+            shm.close()
+            raise ValueError(f"Shared memory segment '{shm.name}' does not contain a lib2fas vault.")
+
+        self._shm = shm
+        self._owner = owner
+        self._buf = shm.buf.toreadonly()
+
+        magic, count, key_count, *self._groups = _HEADER.unpack_from(self._buf, 0)
+        self._count: int = count
+        self._key_count: int = key_count
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Shared memory segment '{shm.name}' does not contain a lib2fas vault.")
+
+        self._records_offset = _HEADER.size
+        self._keys_offset = self._records_offset + _RECORD.size * self._count
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the shared memory segment, pass this to `SharedVault.attach()` in the workers.
+        """
+        return self._shm.name
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedVault":
+        """
+        Attach to a vault published by another process.
+        """
+        if sys.version_info >= (3, 13):  # pragma: no cover (coverage runs on the oldest supported version)
+            return cls(shared_memory.SharedMemory(name, track=False))
+
+        # Before 3.13, attaching registers the segment with the resource tracker, which would remove it when this
+        # (worker) process exits. Only the publisher should remove it, so unregister right away:
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(typing.cast(typing.Any, shm)._name, "shared_memory")
+        return cls(shm)
+
+    def _string(self, offset: int, length: int) -> str:
+        return str(self._buf[offset : offset + length], "utf-8")
+
+    def _record(self, idx: int) -> tuple[int, int, int, int, int, int]:
+        offset = self._records_offset + idx * _RECORD.size
+        record: tuple[int, int, int, int, int, int] = _RECORD.unpack_from(self._buf, offset)
+        return record
+
+    def _key(self, idx: int) -> tuple[int, int, int, int]:
+        key: tuple[int, int, int, int] = _KEY.unpack_from(self._buf, self._keys_offset + idx * _KEY.size)
+        return key
+
+    def _load(self, idx: int) -> TwoFactorAuthDetails:
+        *_, json_offset, json_length = self._record(idx)
+        return TwoFactorAuthDetails.load(json.loads(self._string(json_offset, json_length)))
+
+    def _records_for(self, key: str) -> range:
+        """
+        Binary search in the (sorted) key table.
+        """
+        target = key.encode()
+        low, high = 0, self._key_count
+        while low < high:
+            middle = (low + high) // 2
+            offset, length, first, amount = self._key(middle)
+            current = bytes(self._buf[offset : offset + length])
+            if current == target:
+                return range(first, first + amount)
+            elif current < target:
+                low = middle + 1
+            else:
+                high = middle
+
+        return range(0)
+
+    def __len__(self) -> int:
+        """
+        The amount of services.
+        """
+        return self._count
+
+    def __bool__(self) -> bool:
+        """
+        Truthy if there are any services.
+        """
+        return self._count > 0
+
+    def keys(self) -> list[str]:
+        """
+        Return a list of (lowercased) service names, in the same order as the published storage.
+        """
+        keys = [self._key(idx) for idx in range(self._key_count)]
+        return [self._string(offset, length) for offset, length, *_ in sorted(keys, key=lambda key: key[2])]
+
+    def __getitem__(self, item: str) -> list[TwoFactorAuthDetails]:
+        """
+        Get services by exact (case-insensitive) name, like `TwoFactorStorage[...]`.
+        """
+        return [self._load(idx) for idx in self._records_for(item.lower())]
+
+    def groups(self) -> list[GroupDetails]:
+        """
+        Return a list of known groups.
+        """
+        return into_class(json.loads(self._string(*self._groups)), GroupDetails)
+
+    def find(self, target: Optional[str] = None, fuzz_threshold: int = 75) -> TwoFactorStorage[TwoFactorAuthDetails]:
+        """
+        Create a (regular) storage with the matching services, like `TwoFactorStorage.find`.
+
+        Exact matches use a binary search on the names. Fuzzy matching searches the names first,
+         then the JSON of each service (compact, unlike the indented JSON of `repr()`).
+        """
+        target = (target or "").lower()
+        with span("shared.find", entries=self._count) as phase:
+            if not target:
+                matches: typing.Iterable[int] = range(self._count)
+            elif exact := self._records_for(target):
+                matches = exact
+                phase.set(exact=True)
+            else:
+                phase.set(exact=False)
+                matches = [
+                    idx
+                    for offset, length, first, amount in map(self._key, range(self._key_count))
+                    if fuzzy_match(self._string(offset, length), target) > fuzz_threshold
+                    for idx in range(first, first + amount)
+                ]
+                if not matches:
+                    matches = [
+                        idx
+                        for idx in range(self._count)
+                        if fuzzy_match(self._string(*self._record(idx)[4:]).lower(), target) > fuzz_threshold
+                    ]
+
+            entries = [self._load(idx) for idx in sorted(matches)]
+            phase.set(found=len(entries))
+            return new_auth_storage(entries, self.groups())
+
+    def generate(self) -> list[tuple[str, str]]:
+        """
+        Create TOTP codes for all services, straight from the shared data (without building TwoFactorAuthDetails).
+        """
+        with span("shared.generate", entries=self._count):
+            codes = []
+            for idx in range(self._count):
+                name_offset, name_length, secret_offset, secret_length, *_ = self._record(idx)
+                secret = self._string(secret_offset, secret_length)
+                codes.append((self._string(name_offset, name_length), TOTP(secret).now()))
+            return codes
+
+    def close(self) -> None:
+        """
+        Detach from the shared memory (the segment itself stays available for other processes).
+        """
+        self._buf.release()
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """
+        Detach and remove the segment; should be called once, by the process that published it.
+        """
+        self.close()
+        if sys.version_info < (3, 13):
+            # forked workers share the publisher's resource tracker, so their `attach()` also removed its registration.
+            # Register again (a no-op if still registered), so unlinking doesn't make the tracker complain:
+            resource_tracker.register(typing.cast(typing.Any, self._shm)._name, "shared_memory")
+        self._shm.unlink()
+
+    def __enter__(self) -> "SharedVault":
+        """
+        Use as a context manager to close (and unlink, for the publisher) afterwards.
+        """
+        return self
+
+    def __exit__(self, *_: typing.Any) -> None:
+        """
+        Close the view; the publishing process also removes the segment.
+        """
+        if self._owner:
+            self.unlink()
+        else:
+            self.close()
+
+    def __repr__(self) -> str:
+        """
+        Representation for repr().
+        """
+        return f"<SharedVault '{self.name}' with {self._key_count} keys and {self._count} entries>"
+
+
+def publish(storage: TwoFactorStorage[TwoFactorAuthDetails], name: Optional[str] = None) -> SharedVault:
+    """
+    Copy a storage into a new shared memory segment, once, in the parent process.
+
+    Returns:
+        A SharedVault owned by this process: call `.unlink()` (or use it as a context manager) when done.
+    """
+    with span("shared.publish", entries=len(storage)) as phase:
+        data = _pack(storage)
+        phase.set(bytes=len(data))
+
+        shm = shared_memory.SharedMemory(name, create=True, size=max(len(data), 1))
+        typing.cast(memoryview, shm.buf)[: len(data)] = data
+        return SharedVault(shm, owner=True)
@@ -7,6 +7,8 @@ import typing
 from more_itertools import flatten as _flatten
 from rapidfuzz import fuzz
 
+from ._types import AnyDict
+
 T = typing.TypeVar("T")
 
 
@@ -22,3 +24,27 @@ def fuzzy_match(val1: str, val2: str) -> float:
     Wrapper around `fuzz.partial_ratio` with a slighly more friendly name.
     """
     return fuzz.partial_ratio(val1, val2)
+
+
+def normalize_names(names: typing.Optional[str | typing.Iterable[str]]) -> typing.Optional[set[str]]:
+    """
+    Turn a service name (or collection of names) into a set of lowercased names, for case-insensitive lookup.
+
+    None means 'no filter' and is passed through as-is.
+    """
+    if names is None:
+        return None
+    if isinstance(names, str):
+        names = [names]
+    return {name.lower() for name in names}
+
+
+def select_by_name(entries: list[AnyDict], names: typing.Optional[set[str]]) -> list[AnyDict]:
+    """
+    Keep only the (raw) service dicts whose name is in 'names' (which should already be lowercased).
+
+    This works on the plain dicts, so no TwoFactorAuthDetails has to be built for services that are not requested.
+    """
+    if names is None:
+        return entries
+    return [entry for entry in entries if (entry.get("name") or "").lower() in names]
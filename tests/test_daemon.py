@@ -0,0 +1,181 @@
+import json
+import os
+import shutil
+import socket
+import stat
+import threading
+
+import pytest
+
+from src.lib2fas._security import keyring_manager
+from src.lib2fas.daemon import TotpClient, TotpService, default_socket_path, serve
+from src.lib2fas.instrumentation import PhaseEvent, observing
+
+from ._shared import CWD
+
+
+@pytest.fixture
+def vault(tmp_path):
+    path = tmp_path / "vault.2fas"
+    shutil.copy(CWD / "2fas-demo-nopass.2fas", path)
+    yield path
+
+
+@pytest.fixture
+def server(tmp_path, vault):
+    server = serve(vault, tmp_path / "lib2fas.sock")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_socket(server):
+    assert stat.S_IMODE(os.stat(server.socket_path).st_mode) == 0o600
+
+
+def test_batch(server):
+    with TotpClient(server.socket_path) as client:
+        example_1, example_2 = client.generate("Example 1", "example 2")
+        assert [name for name, _ in example_1] == ["Example 1", "Example 1"]
+        assert len(example_2) == 1 and len(example_2[0][1]) == 6
+
+        assert len(client.generate()[0]) == 4
+        assert client.generate(group="Folder 1")[0][0][0] == "Example 3"
+
+        (found,) = client.find("alice@google")
+        assert {"name": "Example 2", "account": "alice@google", "issuer": "Example", "groupId": None} in found
+        assert all("secret" not in service for service in found)
+
+        assert client.keys() == ["example 1", "example 2", "example 3"]
+
+        # raw protocol: unknown ops and bad requests don't break the batch
+        unknown, invalid, broken, keys = client.request(
+            {"op": "fake"}, "not an object", {"op": "find", "target": "x", "fuzz_threshold": "high"}, {"op": "keys"}
+        )
+        assert not unknown["ok"] and not invalid["ok"] and not broken["ok"] and keys["ok"]
+
+        with pytest.raises(RuntimeError):
+            client._unwrap(unknown, "codes")
+
+
+def test_invalid_json(server):
+    with TotpClient(server.socket_path) as client:
+        client._file.write(b"{not json\n")
+        client._file.flush()
+        assert json.loads(client._file.readline()) == [{"ok": False, "error": "Invalid JSON."}]
+
+
+def test_reload(server, vault):
+    events: list[PhaseEvent] = []
+    with TotpClient(server.socket_path) as client:
+        assert len(client.keys()) == 3
+
+        data = json.loads(vault.read_text())
+        data["services"] = data["services"][:1]
+        vault.write_text(json.dumps(data))
+        assert client.keys() == ["example 1"]
+
+        # a broken file keeps the previous version, and is only tried once until it changes again:
+        vault.write_text("{broken")
+        with observing(events.append):
+            assert client.keys() == ["example 1"]
+            assert client.keys() == ["example 1"]
+            assert [event.name for event in events].count("daemon.reload") == 1
+
+            vault.write_text(json.dumps(data))
+            assert client.keys() == ["example 1"]
+            assert [event.name for event in events].count("daemon.reload") == 2
+
+
+def test_encrypted(tmp_path):
+    service = TotpService(CWD / "2fas-demo-pass.2fas", passphrase="test")
+    assert len(service.storage) == 4
+    assert service.handle([{"op": "generate", "target": "Example 2"}])[0]["ok"]
+
+    with pytest.raises(FileNotFoundError):
+        TotpService(tmp_path / "missing.2fas")
+
+
+def test_reload_never_prompts(tmp_path, monkeypatch):
+    vault = tmp_path / "vault.2fas"
+    shutil.copy(CWD / "2fas-demo-pass.2fas", vault)
+
+    # only the first load (in the main thread) may ask for the passphrase:
+    monkeypatch.setattr("getpass.getpass", lambda _: "test")
+    service = TotpService(vault)
+    assert service.passphrase == "test"
+
+    def prompt(_):
+        raise AssertionError("Reloading should not prompt.")
+
+    monkeypatch.setattr("getpass.getpass", prompt)
+    os.utime(vault, ns=(0, 0))
+    assert len(service.storage) == 4
+
+    # a passphrase that doesn't work anymore keeps the previous version:
+    service.passphrase = "wrong"
+    os.utime(vault, ns=(1, 1))
+    assert len(service.storage) == 4
+
+    keyring_manager.delete_credentials(str(vault))
+
+
+def test_default_socket_path(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert default_socket_path() == tmp_path / "lib2fas.sock"
+
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert default_socket_path().parent.name == f"lib2fas-{os.getuid()}"
+
+
+def test_default_socket_dir(monkeypatch, tmp_path, vault):
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+    # the fallback (in the world-writable temp dir) is in a private directory:
+    with serve(vault) as server:
+        assert server.socket_path.parent == tmp_path / f"lib2fas-{os.getuid()}"
+        assert stat.S_IMODE(server.socket_path.parent.stat().st_mode) == 0o700
+
+    server.socket_path.parent.chmod(0o755)
+    with pytest.raises(PermissionError):
+        serve(vault)
+
+
+def test_socket_path_in_use(server, vault, tmp_path):
+    # never replace something that isn't a socket:
+    important = tmp_path / "important.txt"
+    important.write_text("keep me")
+    with pytest.raises(FileExistsError):
+        serve(vault, important)
+    assert important.read_text() == "keep me"
+
+    # or the socket of a server that is still running:
+    with pytest.raises(FileExistsError):
+        serve(vault, server.socket_path)
+    with TotpClient(server.socket_path) as client:
+        assert client.keys()
+
+    # a stale socket (from a server that is gone) is replaced:
+    stale = tmp_path / "stale.sock"
+    leftover = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    leftover.bind(str(stale))
+    leftover.close()
+    with serve(vault, stale) as new_server:
+        assert new_server.socket_path.is_socket()
+
+
+def test_client_checks_owner(server, monkeypatch):
+    monkeypatch.setattr("os.getuid", lambda: os.stat(server.socket_path).st_uid + 1)
+    with pytest.raises(PermissionError):
+        TotpClient(server.socket_path)
+
+
+def test_vault_removed(server, vault):
+    with TotpClient(server.socket_path) as client:
+        keys = client.keys()
+        vault.unlink()
+        # keeps serving the loaded version:
+        assert client.keys() == keys
@@ -1,10 +1,12 @@
+import io
 import json
 
 import pytest
+from configuraptor import asdict
 
 from src.lib2fas import load_services
 from src.lib2fas._types import TwoFactorAuthDetails
-from src.lib2fas.core import TwoFactorStorage
+from src.lib2fas.core import TwoFactorStorage, new_auth_storage
 
 from ._shared import CWD
 
@@ -114,3 +116,185 @@ def test_search_fuzzy(services):
         == [_[1] for _ in services.find().generate()]
         == [_.generate() for _ in services]
     )  # generate all
+
+
+def test_load_only():
+    only_one = load_services(FILENAME, only="example 1")
+    assert len(only_one) == 2
+    assert only_one.keys() == ["example 1"]
+
+    multiple = load_services(FILENAME, only=["Example 1", "EXAMPLE 2", "missing"])
+    assert len(multiple) == 3
+
+    assert not load_services(FILENAME, only=[])
+
+
+def test_groups(services):
+    assert [group.name for group in services.groups()] == ["Folder 1"]
+    group_id = services.groups()[0].id
+
+    folder = services.group("folder 1")
+    assert len(folder) == 1
+    assert list(folder) == list(services.group(group_id))
+    assert folder.groups() == services.groups()
+    assert not services.group("missing")
+
+    assert len(services.find("example", group="Folder 1")) == 1
+    assert len(services.find(group="Folder 1")) == 1
+    assert not services.find("___", group="Folder 1")
+
+    assert services.generate(group="Folder 1") == folder.generate()
+    assert len(services.generate(group="Folder 1")) == 1
+
+    # found subsets keep knowing the groups:
+    assert services.find("example").group("Folder 1")
+
+
+def test_secondary_indexes(services):
+    assert [_.name for _ in services.by_issuer("example")] == ["Example 1", "Example 2"]
+    assert [_.secret for _ in services.by_account("ALICE@google")] == ["JBSWY3DPEHPK3PXW"]
+    assert len(services.by_secret("jbswy3dpehpk3pxp")) == 1
+    assert services.lookup("account", "nobody") == []
+
+    with pytest.raises(KeyError):
+        services.lookup("fake index", "value")
+
+    assert not services.duplicates()
+    assert services.duplicates("issuer") == {"example": services.by_issuer("Example")}
+
+    # adding the same services again makes everything a duplicate:
+    services.add(services.all())
+    assert len(services.duplicates()) == 4
+    assert len(services.by_secret("JBSWY3DPEHPK3PXP")) == 2
+
+
+class LabelStorage(TwoFactorStorage[TwoFactorAuthDetails]):
+    indexes = {**TwoFactorStorage.indexes, "label": lambda entry: entry.otp.label if entry.otp else None}
+
+
+def test_subclass_indexes(services):
+    storage = new_auth_storage(services.all(), services.groups(), storage_class=LabelStorage)
+    label = storage.all()[0].otp.label
+    assert len(storage.lookup("label", label)) == 1
+
+    # derived storages keep the subclass (and its indexes):
+    assert isinstance(storage.find("example"), LabelStorage)
+    assert storage.find("example").lookup("label", label)
+    assert isinstance(storage.group("Folder 1"), LabelStorage)
+
+    snapshot = storage.snapshot()
+    snapshot.add(storage[storage.all()[0].name])
+    assert len(snapshot.lookup("label", label)) == 2
+    assert len(storage.lookup("label", label)) == 1
+
+
+def test_ordered(services):
+    ordered = services.ordered()
+    assert [_.order.position for _ in ordered] == [0, 1, 2, 3]
+
+    first = TwoFactorAuthDetails.load({"name": "First", "secret": "ABC", "updatedAt": 0, "order": {"position": -1}})
+    services.add([first])
+    assert services.ordered()[0].name == "First"
+    assert services.ordered()[1:] == ordered
+
+
+def test_merge(services):
+    original = services.all()
+
+    # merging the same services again changes nothing:
+    report = services.merge(load_services(FILENAME))
+    assert not report.added and not report.replaced
+    assert len(report.skipped) == 4
+    assert len(services) == 4
+
+    newer = TwoFactorAuthDetails.load({**original[0].as_dict(), "name": "Renamed", "updatedAt": 1})
+    newer.updatedAt = original[0].updatedAt + 1
+    older = TwoFactorAuthDetails.load({**original[1].as_dict(), "updatedAt": 0})
+    new = TwoFactorAuthDetails.load({"name": "New", "secret": "NEWSECRET", "updatedAt": 0})
+    new_duplicate = TwoFactorAuthDetails.load({"name": "New", "secret": "NEWSECRET", "updatedAt": 1})
+
+    report = services.merge([newer, older, new, new_duplicate])
+    assert report.added == [new_duplicate]
+    assert report.replaced == [(original[0], newer)]
+    assert report.skipped == [new, older]
+
+    assert len(services) == 5
+    assert services["renamed"] == [newer]
+    assert services["example 1"] == [original[1]]
+    assert original[0] not in services.ordered()
+    assert services.by_secret(newer.secret) == [newer]
+
+    # existing duplicates (from add) are cleaned up by a newer version:
+    services.add([older])
+    assert len(services.by_secret(older.secret)) == 2
+    newest = TwoFactorAuthDetails.load({**older.as_dict(), "updatedAt": original[1].updatedAt + 1})
+    report = services.merge([newest])
+    assert len(report.replaced) == 2
+    assert services.by_secret(older.secret) == [newest]
+    assert len(services) == len(services.ordered()) == 5
+
+
+def test_merge_input_order(services):
+    # when the input itself has multiple versions, the newest one wins regardless of order:
+    newer_x = TwoFactorAuthDetails.load({"name": "X", "secret": "XSECRET", "updatedAt": 2})
+    older_x = TwoFactorAuthDetails.load({"name": "X", "secret": "XSECRET", "updatedAt": 1})
+
+    report = services.merge([newer_x, older_x])
+    assert report.added == [newer_x]
+    assert report.skipped == [older_x]
+    assert services["x"] == [newer_x]
+
+
+def test_merge_same_object_twice(services):
+    # the same objects are stored twice:
+    services.add(services.all())
+    assert len(services) == 8
+
+    first = services.all()[0]
+    newer = TwoFactorAuthDetails.load({**first.as_dict(), "updatedAt": first.updatedAt + 1})
+    report = services.merge([newer])
+
+    assert report.replaced == [(first, newer)]
+    assert len(services) == len(list(services)) == len(services.ordered()) == 7
+
+
+def test_export(services):
+    ndjson = io.StringIO()
+    assert services.export(ndjson) == 4
+    lines = ndjson.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == [service.as_dict() for service in services]
+
+    array = io.StringIO()
+    assert services.export(array, "json") == 4
+    assert json.loads(array.getvalue()) == [service.as_dict() for service in services]
+
+    empty = io.StringIO()
+    assert TwoFactorStorage().export(empty, "json") == 0
+    assert json.loads(empty.getvalue()) == []
+
+    selected = io.StringIO()
+    services.export(selected, fields=["name", "secret", "otp"], redact=True)
+    first = json.loads(selected.getvalue().splitlines()[0])
+    assert list(first) == ["name", "secret", "otp"]
+    assert first["secret"] == "<redacted>"
+    assert "N5LVC5JZNVVDSUZPJFIWUZSHGFDGMZJU" not in selected.getvalue()
+    assert first["otp"]["link"] == "otpauth://totp/Ledgy:Elon Must?secret=<redacted>&issuer=Ledgy"
+
+    # redacting does not change the services themselves:
+    assert services["example 1"][0].secret == "N5LVC5JZNVVDSUZPJFIWUZSHGFDGMZJU"
+
+    with pytest.raises(ValueError):
+        services.export(io.StringIO(), "xml")
+
+    # invalid fields are rejected before anything is written:
+    truncated = io.StringIO()
+    with pytest.raises(ValueError):
+        services.export(truncated, "json", fields=["name", "fake"])
+    assert truncated.getvalue() == ""
+
+
+def test_as_dict_compatible(services):
+    # the precompiled extractor must give the same result as configuraptor's reflective asdict:
+    for service in [*services, *load_services(CWD / "2fas-demo-minimal.2fas")]:
+        service.generate()  # sets the internal _topt, which should not be dumped
+        assert service.as_dict() == asdict(service, with_top_level_key=False, exclude_internals=2)
@@ -91,3 +91,45 @@ def test_dummy_keyring(getpass_correct):
     assert dummy.retrieve_credentials(key) == PASSWORD
     assert dummy.delete_credentials(key) is None
     assert dummy.retrieve_credentials(key) is None
+
+
+def test_load_only_encrypted():
+    services = load_services(FILENAME, passphrase=PASSWORD)
+    name = services.keys()[0]
+
+    subset = load_services(FILENAME, passphrase=PASSWORD, only=name)
+    assert subset.keys() == [name]
+    assert len(subset) == len(services[name])
+
+    assert not load_services(FILENAME, passphrase=PASSWORD, only="does not exist")
+
+
+def test_key_cache():
+    from src.lib2fas import _security
+
+    _security.clear_key_cache()
+    with pytest.raises(PermissionError):
+        load_services(FILENAME, passphrase="wrong guess")
+    assert load_services(FILENAME, passphrase=PASSWORD)
+
+    # cached by hash, so no passphrases are kept around:
+    assert len(_security._key_cache) == 2
+    assert all(PASSWORD.encode() not in key and b"wrong guess" not in key for key in _security._key_cache)
+
+    _security.clear_key_cache()
+    assert not _security._key_cache
+
+
+def test_key_cache_eviction(monkeypatch):
+    from src.lib2fas import _security
+
+    _security.clear_key_cache()
+    monkeypatch.setattr(_security, "KEY_CACHE_SIZE", 1)
+
+    first = _security.derive_key("first", b"salt")
+    _security.derive_key("second", b"salt")
+    assert list(_security._key_cache) == [_security._cache_key("second", b"salt")]
+
+    # evicted keys are derived again (with the same result):
+    assert _security.derive_key("first", b"salt") == first
+    assert list(_security._key_cache) == [_security._cache_key("first", b"salt")]
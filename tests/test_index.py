@@ -0,0 +1,127 @@
+import base64
+import json
+import shutil
+
+import pytest
+
+from src.lib2fas import load_service_names, load_services
+from src.lib2fas._index import index_path, read_index, service_spans
+from src.lib2fas._security import _encrypt_bytes
+
+from ._shared import CWD
+
+PASSWORD = "test"
+
+
+@pytest.fixture
+def vault(tmp_path):
+    path = tmp_path / "vault.2fas"
+    shutil.copy(CWD / "2fas-demo-pass.2fas", path)
+    yield path
+
+
+def test_spans():
+    plaintext = b'[{"name": "a]}", "nested": {"x": [1, 2]}}, {"name": "b\\"{"}]'
+    spans = service_spans(plaintext)
+    assert [plaintext[start:end] for start, end in spans] == [
+        b'{"name": "a]}", "nested": {"x": [1, 2]}}',
+        b'{"name": "b\\"{"}',
+    ]
+
+
+def test_index_created(vault):
+    assert not index_path(vault).exists()
+
+    full = load_services(vault, passphrase=PASSWORD, use_index=True)
+    assert index_path(vault).exists()
+
+    index = read_index(vault, PASSWORD)
+    assert index
+    assert [entry.name.lower() for entry in index] == [service.name.lower() for service in full]
+
+    with pytest.raises(PermissionError):
+        read_index(vault, "wrong")
+
+
+def test_index_lookup(vault, monkeypatch):
+    full = load_services(vault, passphrase=PASSWORD, use_index=True)
+    name = full.keys()[0]
+
+    def fail(_):
+        raise AssertionError("should not parse the whole file")
+
+    monkeypatch.setattr("src.lib2fas._index._loads_services", fail)
+
+    subset = load_services(vault, passphrase=PASSWORD, only=name, use_index=True)
+    assert subset.keys() == [name]
+    assert [_.secret for _ in subset] == [_.secret for _ in full[name]]
+
+    assert load_service_names(vault, passphrase=PASSWORD) == full.keys()
+
+
+def test_index_invalidated(vault):
+    load_services(vault, passphrase=PASSWORD, use_index=True)
+    assert read_index(vault, PASSWORD) is not None
+
+    # same content, newer mtime: hash still matches
+    vault.write_bytes(vault.read_bytes())
+    assert read_index(vault, PASSWORD) is not None
+
+    # other content: outdated
+    vault.write_text(vault.read_text().replace('"appOrigin"', '"changed": 1, "appOrigin"'))
+    assert read_index(vault, PASSWORD) is None
+
+    # rebuilt on next use:
+    assert load_service_names(vault, passphrase=PASSWORD)
+    assert read_index(vault, PASSWORD) is not None
+
+
+def test_names_without_index(vault):
+    assert load_service_names(CWD / "2fas-demo-nopass.2fas") == ["example 1", "example 2", "example 3"]
+    assert load_service_names("/tmp/fake_file_for_test_names.2fas") is None
+
+    index_path(vault).write_text("not json")
+    assert load_service_names(vault, passphrase=PASSWORD)
+
+
+@pytest.mark.parametrize(
+    "damage",
+    [
+        lambda index: index.pop("entries"),
+        lambda index: index.update(entries="not:base64!:data"),
+        lambda index: index.update(entries=1),
+        lambda index: index.update(source=None),
+        lambda index: index.update(version=0),
+    ],
+)
+def test_index_damaged(vault, damage):
+    full = load_services(vault, passphrase=PASSWORD, use_index=True)
+
+    index = json.loads(index_path(vault).read_text())
+    damage(index)
+    index_path(vault).write_text(json.dumps(index))
+    assert read_index(vault, PASSWORD) is None
+
+    # a damaged index is rebuilt, instead of failing the load:
+    name = full.keys()[0]
+    assert load_services(vault, passphrase=PASSWORD, only=name, use_index=True).keys() == [name]
+    assert read_index(vault, PASSWORD) is not None
+
+
+def test_index_wrong_entries(vault):
+    load_services(vault, passphrase=PASSWORD, use_index=True)
+    index = json.loads(index_path(vault).read_text())
+
+    _, salt, _ = index["entries"].split(":")
+    index["entries"] = _encrypt_bytes(json.dumps([["too", "short"]]).encode(), PASSWORD, base64.b64decode(salt))
+    index_path(vault).write_text(json.dumps(index))
+    assert read_index(vault, PASSWORD) is None
+
+
+def test_index_full_load(vault):
+    full = load_services(vault, passphrase=PASSWORD, use_index=True)
+    # with a fresh index, loading everything gives the same result:
+    assert load_services(vault, passphrase=PASSWORD, use_index=True).all() == full.all()
+
+    with pytest.raises(PermissionError):
+        load_services(vault, passphrase="wrong", use_index=True)
@@ -0,0 +1,99 @@
+import pytest
+
+from src.lib2fas import instrumentation, load_services
+from src.lib2fas.instrumentation import OpenTelemetryObserver, PhaseEvent, observing, span
+
+from ._shared import CWD
+
+
+class Recorder:
+    def __init__(self):
+        self.events: list[PhaseEvent] = []
+
+    def __call__(self, event: PhaseEvent):
+        self.events.append(event)
+
+    @property
+    def names(self):
+        return [event.name for event in self.events]
+
+
+def test_disabled():
+    assert not instrumentation._observers
+    with span("nothing", size=1) as phase:
+        phase.set(more=2)
+
+    assert phase is instrumentation._NOOP
+    assert not phase.attributes
+
+
+def test_load_plain():
+    with observing(Recorder()) as recorder:
+        services = load_services(CWD / "2fas-demo-nopass.2fas")
+        services.find("Example 1")
+        services.find("exampel")
+        services.generate()
+
+    assert not instrumentation._observers
+
+    assert recorder.names[:4] == ["read", "parse", "into_class", "into_class"]
+    assert recorder.names.count("storage.find") == 2
+    assert "storage.generate" in recorder.names
+
+    load, *_ = (event for event in recorder.events if event.name == "load_services")
+    assert load.attributes["entries"] == 4
+    assert load.duration_ns > 0
+    assert load.duration == load.duration_ns / 1e9
+
+    read = recorder.events[0]
+    assert read.attributes["bytes"] == (CWD / "2fas-demo-nopass.2fas").stat().st_size
+
+    exact, fuzzy = (event for event in recorder.events if event.name == "storage.find")
+    assert exact.attributes == {"entries": 4, "exact": True, "found": 2}
+    assert fuzzy.attributes["exact"] is False
+
+
+def test_load_encrypted():
+    with observing(Recorder()) as recorder, pytest.raises(PermissionError):
+        load_services(CWD / "2fas-demo-pass.2fas", passphrase="not-cached-yet")
+    assert "kdf" in recorder.names
+    assert "aes_gcm.decrypt" in recorder.names
+    assert "parse_plaintext" not in recorder.names  # invalid passphrase
+
+    with observing(Recorder()) as recorder:
+        load_services(CWD / "2fas-demo-pass.2fas", passphrase="test")
+        load_services(CWD / "2fas-demo-pass.2fas", passphrase="test")
+
+    assert recorder.names.count("aes_gcm.decrypt") == 2
+    assert recorder.names.count("kdf") <= 1  # derived key is cached
+    assert "parse_plaintext" in recorder.names
+
+
+class FakeSpan:
+    def __init__(self, name, start_time, attributes):
+        self.name = name
+        self.start_time = start_time
+        self.attributes = attributes
+        self.end_time = None
+
+    def end(self, end_time):
+        self.end_time = end_time
+
+
+class FakeTracer:
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, start_time=None, attributes=None):
+        self.spans.append(FakeSpan(name, start_time, attributes))
+        return self.spans[-1]
+
+
+def test_opentelemetry():
+    tracer = FakeTracer()
+    with observing(OpenTelemetryObserver(tracer)):
+        load_services(CWD / "2fas-demo-nopass.2fas")
+
+    assert tracer.spans[0].name == "lib2fas.read"
+    assert all(otel_span.end_time >= otel_span.start_time for otel_span in tracer.spans)
+    assert tracer.spans[-1].name == "lib2fas.load_services"
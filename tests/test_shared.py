@@ -0,0 +1,91 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import pytest
+
+from src.lib2fas import load_services
+from src.lib2fas.core import new_auth_storage
+from src.lib2fas.shared import SharedVault, publish
+
+from ._shared import CWD
+
+
+@pytest.fixture
+def storage():
+    yield load_services(CWD / "2fas-demo-nopass.2fas")
+
+
+@pytest.fixture
+def vault(storage):
+    with publish(storage) as vault:
+        yield vault
+
+
+def test_layout(storage, vault):
+    assert len(vault) == len(storage)
+    assert vault
+    assert vault.keys() == storage.keys()
+    assert [group.name for group in vault.groups()] == [group.name for group in storage.groups()]
+    assert "SharedVault" in repr(vault)
+
+
+def test_lookups(storage, vault):
+    assert vault["Example 1"] == storage["Example 1"]
+    assert vault["missing"] == []
+
+    assert vault.find("example 2").all() == storage.find("example 2").all()
+    assert vault.find("exampel 2").keys() == storage.find("exampel 2").keys()
+    assert vault.find().keys() == storage.keys()
+    assert not vault.find("___")
+    # no name matches, so this searches the values:
+    assert vault.find("alice@google").keys() == storage.find("alice@google").keys() != []
+
+    codes = dict(vault.generate())
+    assert codes == dict(storage.generate())
+
+
+def test_read_only(vault):
+    attached = SharedVault.attach(vault.name)
+    with pytest.raises(TypeError):
+        attached._buf[0] = 0
+    attached.close()
+
+
+@pytest.mark.parametrize("size", [64, 8])
+def test_invalid_segment(size):
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        with pytest.raises(ValueError):
+            SharedVault(shm)
+    finally:
+        shm.unlink()
+
+
+def test_empty():
+    with publish(new_auth_storage()) as vault:
+        assert not vault
+        assert vault.keys() == [] and vault.generate() == []
+
+
+def _worker(name: str, queue: multiprocessing.Queue) -> None:
+    with SharedVault.attach(name) as vault:
+        queue.put((vault.keys(), [entry.name for entry in vault.find("example 1")]))
+
+
+def test_workers(storage, vault):
+    context = multiprocessing.get_context("fork")  # pre-fork servers
+    queue = context.Queue()
+    workers = [context.Process(target=_worker, args=(vault.name, queue)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+
+    results = [queue.get(timeout=10) for _ in workers]
+    for worker in workers:
+        worker.join(timeout=10)
+        assert worker.exitcode == 0
+
+    assert results == [(storage.keys(), ["Example 1", "Example 1"])] * 3
+
+    # workers exiting must not remove the segment:
+    with SharedVault.attach(vault.name) as attached:
+        assert len(attached) == len(storage)
@@ -0,0 +1,107 @@
+import sys
+import threading
+from base64 import b32encode
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.lib2fas import load_services
+from src.lib2fas._types import TwoFactorAuthDetails
+from src.lib2fas.core import new_auth_storage
+
+from ._shared import CWD
+
+BATCHES = 50
+BATCH_SIZE = 20
+READERS = 8
+
+
+def batch(idx: int) -> list[TwoFactorAuthDetails]:
+    return [
+        TwoFactorAuthDetails.load(
+            {
+                "name": f"batch {idx}",
+                "secret": b32encode(f"{idx:05}-{n:04}".encode()).decode(),
+                "updatedAt": 0,
+                "order": {"position": n},
+            }
+        )
+        for n in range(BATCH_SIZE)
+    ]
+
+
+@pytest.fixture
+def fast_switching():
+    # switch threads as often as possible to provoke races (no-op for free-threaded builds)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_snapshot():
+    storage = load_services(CWD / "2fas-demo-nopass.2fas")
+    snapshot = storage.snapshot()
+    storage.add(batch(0))
+
+    assert len(snapshot) == 4
+    assert len(storage) == 4 + BATCH_SIZE
+    assert not snapshot["batch 0"]
+
+    # writing to a snapshot doesn't change the original:
+    snapshot.add(batch(1))
+    assert len(snapshot) == 4 + BATCH_SIZE
+    assert not storage["batch 1"]
+
+    # reading never creates keys:
+    assert not storage["missing"]
+    assert "missing" not in storage.keys()
+
+
+def test_concurrent_readers(fast_switching):
+    storage = new_auth_storage(concurrent=True)
+    batches = [batch(idx) for idx in range(BATCHES)]
+    done = threading.Event()
+
+    def write():
+        try:
+            for idx, entries in enumerate(batches):
+                if idx % 2:
+                    storage.add(entries)
+                else:
+                    storage.merge(entries)
+        finally:
+            done.set()
+
+    def read(reader: int) -> int:
+        checks = 0
+        while not done.is_set() or not checks:
+            # every batch is published as a whole, so a reader never sees part of one:
+            assert len(storage[f"batch {reader}"]) in (0, BATCH_SIZE)
+            assert len(storage.find(f"batch {reader}", fuzz_threshold=100)) in (0, BATCH_SIZE)
+            assert len(storage.generate()) % BATCH_SIZE == 0
+
+            snapshot = storage.snapshot()
+            assert len(snapshot) == len(snapshot.all()) == len(snapshot.ordered()) == len(snapshot.generate())
+            assert len(snapshot) % BATCH_SIZE == 0
+            checks += 1
+        return checks
+
+    with ThreadPoolExecutor(READERS + 1) as pool:
+        writer = pool.submit(write)
+        readers = [pool.submit(read, reader) for reader in range(READERS)]
+        writer.result()
+        assert all(reader.result() for reader in readers)
+
+    assert len(storage) == BATCHES * BATCH_SIZE
+    assert len(storage.ordered()) == BATCHES * BATCH_SIZE
+
+
+def test_concurrent_totp(fast_switching):
+    service = batch(0)[0]
+
+    with ThreadPoolExecutor(READERS) as pool:
+        codes = set(pool.map(lambda _: service.generate(), range(100)))
+
+    # all threads got a working TOTP (the code can only differ if the 30s window changed during the test):
+    assert 1 <= len(codes) <= 2